@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pymupdf
+import yaml
+from blk_analysis import parse_arguments, apply_config_file, analyze_document, load_global_config
+from blocks.image_table_extractor import TABLE_DETECTION_MODES
+from blocks.section_search import SectionSearchIndex
+
+# global configuration of a worker process, loaded once by _init_worker
+_worker_global_config = None
+
+# blk_analysis options a manifest cannot set per document: the batch has a
+# single search index writer and the profiler is not enabled in the workers
+BATCH_ONLY_OPTIONS = ('input_file', 'config_file', 'search_index', 'profile')
+
+
+def parse_batch_arguments():
+    """
+    Parse command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Process a directory (or a manifest) of PDFs with blk_analysis in one long running process pool')
+    parser.add_argument('input', help='Directory of PDF files, or a YAML manifest listing the documents')
+    parser.add_argument('-ad', '--appdir', help='Application directory', default='pdf_blocks')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of documents processed in parallel')
+    parser.add_argument('-cfg', '--config_file', help='YAML configuration of the documents that have no configuration of their own')
+    parser.add_argument('-gcfg', '--global_config', default='config_blk_analysis.yaml', help='Global configuration file')
+    parser.add_argument('-of', '--output_format', choices=['json', 'jsonl', 'pblk'], default='json', help='Page data output format (see blk_analysis.py)')
+    parser.add_argument('-z', '--compress', action='store_true', help='zstd compress the pages of pblk block files')
+    parser.add_argument('-td', '--table_detection', choices=TABLE_DETECTION_MODES, default='always', help='Table detection mode')
+    parser.add_argument('-cache', '--cache_dir', help='Directory of the persistent per-page extraction cache (disabled if not given)')
+    parser.add_argument('-fuse', '--fused', action='store_true', help='Analyze each page as soon as it is extracted (use with -of jsonl or pblk, json output keeps all the pages in memory)')
+    parser.add_argument('-resume', '--resume', action='store_true', help='Checkpoint the pages of every document and continue the documents of an interrupted batch from their last checkpointed page')
+    parser.add_argument('-si', '--search_index', help='Add the sections of every processed document to this search index')
+    return parser.parse_args()
+
+
+def manifest_documents(manifest_file):
+    """
+    The documents of a YAML manifest: a list (or a 'documents' list) of entries
+    that are either the path of a PDF or a mapping with its input_file, an
+    optional config_file and any other blk_analysis options for the document.
+    Relative paths are relative to the manifest.
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = yaml.safe_load(f) or []
+    if isinstance(manifest, dict):
+        manifest = manifest.get('documents', [])
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    documents = []
+    for entry in manifest:
+        document = dict(entry) if isinstance(entry, dict) else {'input_file': entry}
+        for key in ('input_file', 'config_file'):
+            if document.get(key):
+                document[key] = os.path.join(base_dir, document[key])
+        documents.append(document)
+    return documents
+
+
+def directory_documents(input_dir):
+    """
+    The PDFs of a directory, each with the YAML configuration of the same name
+    (e.g. h264.pdf and h264.yaml) if there is one
+    """
+    documents = []
+    for input_file in sorted(glob.glob(os.path.join(input_dir, '*.pdf'))):
+        document = {'input_file': input_file}
+        config_file = input_file[:-4] + '.yaml'
+        if os.path.exists(config_file):
+            document['config_file'] = config_file
+        documents.append(document)
+    return documents
+
+
+def document_arguments(document, batch_args):
+    """
+    blk_analysis arguments of a document: the batch options, overridden by the
+    document's configuration file and then by its manifest options
+    """
+    args = parse_arguments([document['input_file'], '-ad', batch_args.appdir, '-of', batch_args.output_format,
+                            '-td', batch_args.table_detection])
+    args.compress = batch_args.compress
+    args.cache_dir = batch_args.cache_dir
+    args.fused = batch_args.fused
+    args.resume = batch_args.resume
+    args.config_file = document.get('config_file') or batch_args.config_file
+    apply_config_file(args)
+    options = {key: value for key, value in document.items() if key not in ('input_file', 'config_file')}
+    unknown = [key for key in options if key in BATCH_ONLY_OPTIONS or not hasattr(args, key)]
+    if unknown:
+        raise ValueError(f"Unsupported manifest options: {', '.join(unknown)}")
+    for key, value in options.items():
+        setattr(args, key, value)
+    return args
+
+
+def _init_worker(global_config_file):
+    global _worker_global_config
+    _worker_global_config = load_global_config(global_config_file)
+
+
+def run_document(args):
+    """
+    Run blk_analysis on a document in a worker process, its output goes to
+    blk_analysis.log in the document's output directory
+    """
+    output_dir = args.output_dir if args.output_dir else os.path.basename(args.input_file)[:-4]
+    output_dir_path = os.path.join(args.appdir, output_dir)
+    os.makedirs(output_dir_path, exist_ok=True)
+
+    report = {'input_file': args.input_file, 'output_dir': output_dir_path, 'pages': None, 'sections': None, 'error': None}
+    start = time.perf_counter()
+    with open(os.path.join(output_dir_path, "blk_analysis.log"), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            with pymupdf.open(args.input_file) as doc:
+                report['pages'] = doc.page_count
+            report['sections'] = len(analyze_document(args, _worker_global_config))
+        except Exception:
+            report['error'] = traceback.format_exc()
+            print(report['error'])
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+async def run_batch(documents, batch_args):
+    """
+    Process the documents on a pool of batch_args.jobs worker processes,
+    printing each document's result as it completes
+
+    A worker process that dies (e.g. killed by a crash in MuPDF) breaks the
+    whole pool and fails every document still pending on it. Those documents
+    are run again, each in a pool of its own, so only the document that
+    killed its worker is reported as failed.
+    """
+    loop = asyncio.get_running_loop()
+    reports = []
+    isolated = asyncio.Semaphore(batch_args.jobs)
+
+    async def run_isolated(args):
+        async with isolated:
+            with ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                     initargs=(batch_args.global_config,)) as executor:
+                return await loop.run_in_executor(executor, run_document, args)
+
+    async def process(executor, document):
+        try:
+            args = document_arguments(document, batch_args)
+            try:
+                report = await loop.run_in_executor(executor, run_document, args)
+            except BrokenProcessPool:
+                report = await run_isolated(args)
+        except Exception as e:
+            # bad document options, or the document's own worker process died
+            report = {'input_file': document['input_file'], 'pages': None, 'sections': None, 'seconds': None,
+                      'error': f"{type(e).__name__}: {e}"}
+        reports.append(report)
+
+        index = len(reports)
+        if report['error']:
+            print(f"[{index}/{len(documents)}] FAILED {report['input_file']}: {report['error'].strip().splitlines()[-1]}")
+        else:
+            print(f"[{index}/{len(documents)}] {report['input_file']}: {report['pages']} pages, {report['sections']} sections "
+                  f"in {report['seconds']:.1f}s ({report['pages'] / report['seconds']:.1f} pages/s)")
+            if batch_args.search_index:
+                # ingested here rather than in the workers so the index has a single writer
+                with SectionSearchIndex(batch_args.search_index) as index:
+                    index.ingest_document(report['output_dir'], os.path.basename(report['output_dir']))
+
+    with ProcessPoolExecutor(max_workers=batch_args.jobs, initializer=_init_worker,
+                             initargs=(batch_args.global_config,)) as executor:
+        await asyncio.gather(*(process(executor, document) for document in documents))
+
+    return reports
+
+
+def main():
+    batch_args = parse_batch_arguments()
+
+    if os.path.isdir(batch_args.input):
+        documents = directory_documents(batch_args.input)
+    else:
+        documents = manifest_documents(batch_args.input)
+    if not documents:
+        print(f"No documents found in {batch_args.input}")
+        return
+
+    print(f"Processing {len(documents)} documents with {batch_args.jobs} worker processes")
+    start = time.perf_counter()
+    reports = asyncio.run(run_batch(documents, batch_args))
+    elapsed = time.perf_counter() - start
+
+    completed = [report for report in reports if not report['error']]
+    pages = sum(report['pages'] for report in completed)
+    print(f"\n{len(completed)} of {len(documents)} documents processed, {len(documents) - len(completed)} failed, "
+          f"{pages} pages in {elapsed:.1f}s ({pages / elapsed:.1f} pages/s, {len(completed) / elapsed:.2f} documents/s)")
+
+    os.makedirs(batch_args.appdir, exist_ok=True)
+    report_file = os.path.join(batch_args.appdir, "batch_report.json")
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump({'seconds': elapsed, 'pages': pages, 'documents': reports}, f, ensure_ascii=False, indent=4)
+    print(f"Batch report saved to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
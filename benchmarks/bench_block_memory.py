@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import argparse
+import gc
+import tracemalloc
+import pymupdf
+from blocks.block_extractor import process_block_text
+from blocks.records import Block
+
+
+def extract_blocks(input_file, max_pages):
+    """
+    The blocks of the first max_pages pages of a PDF as page data records
+    """
+    blocks = []
+    with pymupdf.open(input_file) as doc:
+        for page_num in range(min(len(doc), max_pages or len(doc))):
+            page_info = doc.load_page(page_num).get_text("dict")
+            blocks.extend(process_block_text(block) for block in page_info["blocks"])
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory of page blocks held as records and as dicts')
+    parser.add_argument('input_file', help='Input PDF file (a large spec)')
+    parser.add_argument('-p', '--pages', type=int, help='Only extract the first pages')
+    args = parser.parse_args()
+
+    blocks = extract_blocks(args.input_file, args.pages)
+    segments = sum(len(block.text_segments) for block in blocks)
+
+    # both forms reference the same text and font strings, so the difference is
+    # the size of the containers alone
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    record_blocks = [Block.from_dict(block.to_dict()) for block in blocks]
+    record_size = tracemalloc.get_traced_memory()[0] - baseline
+    del record_blocks
+
+    gc.collect()
+    baseline = tracemalloc.get_traced_memory()[0]
+    dict_blocks = [block.to_dict() for block in blocks]
+    dict_size = tracemalloc.get_traced_memory()[0] - baseline
+    del dict_blocks
+    tracemalloc.stop()
+
+    print(f"{len(blocks)} blocks, {segments} text segments")
+    print(f"dicts:   {dict_size / 2**20:8.1f} MB ({dict_size / len(blocks):.0f} bytes/block)")
+    print(f"records: {record_size / 2**20:8.1f} MB ({record_size / len(blocks):.0f} bytes/block)")
+    print(f"records use {100 * (1 - record_size / dict_size):.0f}% less memory")
+
+
+if __name__ == "__main__":
+    main()
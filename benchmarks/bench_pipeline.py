@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import tempfile
+import time
+import yaml
+from blk_analysis import build_regex
+from blocks.image_table_extractor import TABLE_DETECTION_MODES
+from blocks.pdf_processor import preprocess_pdf, analyze_pdf
+from blocks.profiler import enable_profiling
+from blocks.toc_parser import process_toc
+from benchmarks.synthetic_pdf import make_spec_pdf
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux, the workers are counted by RUSAGE_CHILDREN
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss / 1024
+
+
+def run_pipeline(input_file, layout, global_config, output_dir, table_detection, workers):
+    """
+    Run preprocess_pdf, process_toc and analyze_pdf on the PDF, returning the
+    wall time of each
+    """
+    files = {'input': input_file, 'output': os.path.join(output_dir, 'outline.pdf'), 'output_dir': output_dir}
+    config = {
+        'outline_blocks': False,
+        'outline_images': False,
+        'outline_tables': False,
+        'output_dir_path': output_dir,
+        'header_size': 0.07,
+        'footer_size': 0.07,
+        'include_pages': None,
+        'exclude_pages': layout['toc_pages'],
+        'toc_pages': layout['toc_pages'],
+        'workers': workers,
+        'table_detection': table_detection,
+    }
+    toc_parsing_config = global_config.get('common_regex', {}) | global_config['toc_parsing_configurations']['default']
+    toc_regex_pattern = re.compile(build_regex(toc_parsing_config))
+    section_text_dir = os.path.join(output_dir, 'section_text')
+    os.makedirs(section_text_dir, exist_ok=True)
+
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        start = time.perf_counter()
+        result = preprocess_pdf(files, config)
+        timings['preprocess_pdf'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        toc_entries = process_toc(result['toc_data'], os.path.join(output_dir, 'table_of_contents.json'),
+                                  toc_parsing_config, toc_regex_pattern)
+        timings['process_toc'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sections = analyze_pdf(result['filtered_pages_data'], global_config['analysis_config'], section_text_dir)
+        timings['analyze_pdf'] = time.perf_counter() - start
+
+    timings['total'] = sum(timings.values())
+    return timings, {'toc_entries': len(toc_entries), 'sections': len(sections)}
+
+
+def print_comparison(previous, current):
+    print(f"\nCompared with {previous['commit']} ({previous['date']}):")
+    for name, seconds in current['timings'].items():
+        before = previous['timings'].get(name)
+        if before:
+            print(f"  {name:<16}{before:>10.3f}s ->{seconds:>9.3f}s  ({before / seconds:.2f}x)")
+    print(f"  {'peak RSS':<16}{previous['peak_rss_mb']:>9.1f}MB ->{current['peak_rss_mb']:>8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the blocks pipeline end to end and per stage on a synthetic spec PDF')
+    parser.add_argument('-p', '--pages', type=int, default=200, help='Number of pages')
+    parser.add_argument('-s', '--sections_per_page', type=float, default=1.5, help='Numbered section headings per body page')
+    parser.add_argument('-t', '--toc_entries', type=int, default=60, help='Number of table of contents entries')
+    parser.add_argument('-tb', '--tables_per_page', type=float, default=0.25, help='Ruled tables per body page')
+    parser.add_argument('-im', '--images_per_page', type=float, default=0.5, help='Figure images per body page')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic PDF layout')
+    parser.add_argument('-td', '--table_detection', choices=TABLE_DETECTION_MODES, default='always', help='Table detection mode')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes used to extract pages')
+    parser.add_argument('-cfg', '--config_file', default='config_blk_analysis.yaml', help='Global configuration file')
+    parser.add_argument('-o', '--output', help='Save the results to this JSON file')
+    parser.add_argument('-c', '--compare', help='Results JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    with open(args.config_file, 'r') as f:
+        global_config = yaml.safe_load(f)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, 'synthetic.pdf')
+        layout = make_spec_pdf(input_file, args.pages, args.sections_per_page, args.toc_entries,
+                               args.tables_per_page, args.images_per_page, args.seed)
+        output_dir = os.path.join(work_dir, 'output')
+        os.makedirs(output_dir)
+
+        profiler = enable_profiling()
+        timings, found = run_pipeline(input_file, layout, global_config, output_dir, args.table_detection, args.workers)
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'config_file')},
+        'layout': layout,
+        'found': found,
+        'timings': timings,
+        'pages_per_sec': {name: layout['pages'] / seconds for name, seconds in timings.items() if seconds},
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': profiler.stages,
+    }
+
+    print(f"{layout['pages']} pages, {layout['sections']} sections, {layout['tables']} tables, {layout['images']} images "
+          f"(found {found['sections']} sections, {found['toc_entries']} TOC entries)")
+    print(f"{'Phase':<16}{'Wall (s)':>10}{'Pages/s':>10}")
+    for name, seconds in timings.items():
+        print(f"{name:<16}{seconds:>10.3f}{results['pages_per_sec'].get(name, 0):>10.1f}")
+    print(f"{'Stage':<22}{'Calls':>8}{'Wall (s)':>10}{'CPU (s)':>10}")
+    for name, times in sorted(profiler.stages.items(), key=lambda item: -item[1]['wall']):
+        print(f"{name:<22}{times['calls']:>8}{times['wall']:>10.3f}{times['cpu']:>10.3f}")
+    print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(json.load(f), results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
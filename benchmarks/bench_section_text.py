@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+import yaml
+from blocks.block_extractor import process_block_text
+from blocks.pdf_processor import analyze_pdf
+from benchmarks.bench_segments import make_block
+
+
+def single_section_pages(num_blocks, blocks_per_page=50):
+    """
+    Filtered page data holding one very long section of num_blocks body text
+    blocks, closed by a following section heading
+    """
+    blocks = [make_block("Advanced video coding for generic audiovisual services"), make_block("1 Long section")]
+    blocks.extend(make_block("se(v) syntax element descriptor row of a large syntax table") for _ in range(num_blocks))
+    blocks.append(make_block("2 Next section"))
+    return [{"page_number": index // blocks_per_page + 1, "blocks": blocks[index:index + blocks_per_page], "height": 842.0, "width": 595.0}
+            for index in range(0, len(blocks), blocks_per_page)]
+
+
+def many_spans_block(num_spans):
+    """
+    A pymupdf text block with num_spans spans of the same font, one per line
+    """
+    lines = [{"spans": [{"size": 9.0, "font": "Times-Roman", "text": "u(1) syntax element", "origin": (72.0, 100.0 + i)}]}
+             for i in range(num_spans)]
+    return {"number": 0, "type": 0, "bbox": (72.0, 100.0, 520.0, 100.0 + num_spans), "lines": lines}
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show how section text accumulation scales with the section size')
+    parser.add_argument('-n', '--max_blocks', type=int, default=100000, help='Largest section size in blocks (halved down to 1/8)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of timed runs (best is reported)')
+    parser.add_argument('-cfg', '--config_file', default='config_blk_analysis.yaml', help='Global configuration file')
+    args = parser.parse_args()
+
+    with open(args.config_file, 'r') as f:
+        analysis_config = yaml.safe_load(f)['analysis_config']
+
+    sizes = [args.max_blocks // 8, args.max_blocks // 4, args.max_blocks // 2, args.max_blocks]
+
+    print("analyze_pdf, one section of N blocks")
+    with tempfile.TemporaryDirectory() as section_text_dir:
+        for num_blocks in sizes:
+            pages = single_section_pages(num_blocks)
+            best = best_time(lambda: analyze_pdf(pages, analysis_config, section_text_dir), args.repeat)
+            print(f"  {num_blocks:>8} blocks: {best:.3f} s ({1e6 * best / num_blocks:.2f} us/block)")
+
+    print("process_block_text, one block of N spans")
+    for num_spans in sizes:
+        block = many_spans_block(num_spans)
+        best = best_time(lambda: process_block_text(block), args.repeat)
+        print(f"  {num_spans:>8} spans: {best:.3f} s ({1e6 * best / num_spans:.2f} us/span)")
+
+
+if __name__ == "__main__":
+    main()
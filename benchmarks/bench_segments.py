@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+import yaml
+from blocks.pdf_processor import analyze_pdf
+
+
+def make_block(text):
+    return {
+        "block_number": 0,
+        "type": 0,
+        "bbox": {'x0': 72.0, 'top': 100.0, 'x1': 520.0, 'bottom': 120.0},
+        "text_segments": [{"font_size": 9.0, "font": "Times-Roman", "text": text}],
+    }
+
+
+def synthetic_filtered_pages(num_pages, blocks_per_page, section_every):
+    """
+    Filtered page data of a spec like document: a title block starting the main
+    division followed by numbered section headings between body text blocks
+    """
+    pages = []
+    section = 0
+    block_count = 0
+    for page_number in range(1, num_pages + 1):
+        blocks = []
+        if page_number == 1:
+            blocks.append(make_block("Advanced video coding for generic audiovisual services"))
+        for _ in range(blocks_per_page):
+            block_count += 1
+            if block_count % section_every == 0:
+                # number as 1, 1.1 .. 1.49, 2, 2.1 .. to stay within 3 digit section numbers
+                major, minor = divmod(section, 50)
+                number = f"{major + 1}.{minor}" if minor else f"{major + 1}"
+                blocks.append(make_block(f"{number} Heading of section {number}"))
+                section += 1
+            else:
+                blocks.append(make_block("Body text of the section " * 8))
+        pages.append({"page_number": page_number, "blocks": blocks, "height": 842.0, "width": 595.0})
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time analyze_pdf on synthetic filtered page data')
+    parser.add_argument('-p', '--pages', type=int, default=2000, help='Number of pages')
+    parser.add_argument('-b', '--blocks_per_page', type=int, default=20, help='Number of blocks per page')
+    parser.add_argument('-s', '--section_every', type=int, default=15, help='Number of blocks per section heading')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of timed runs (best is reported)')
+    parser.add_argument('-cfg', '--config_file', default='config_blk_analysis.yaml', help='Global configuration file')
+    args = parser.parse_args()
+
+    with open(args.config_file, 'r') as f:
+        analysis_config = yaml.safe_load(f)['analysis_config']
+
+    pages = synthetic_filtered_pages(args.pages, args.blocks_per_page, args.section_every)
+    num_blocks = sum(len(page['blocks']) for page in pages)
+
+    timings = []
+    with tempfile.TemporaryDirectory() as section_text_dir:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                sections = analyze_pdf(pages, analysis_config, section_text_dir)
+            timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    print(f"analyze_pdf: {num_blocks} blocks, {len(sections)} sections, best of {args.repeat}: "
+          f"{best:.3f} s ({1e6 * best / num_blocks:.2f} us/block)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import argparse
+import math
+import random
+import pymupdf
+
+TITLE = "Advanced video coding for generic audiovisual services"
+TOC_LINES_PER_PAGE = 45
+BODY_TOP = 80
+BODY_BOTTOM = 740
+
+
+def spread(count_per_page, page_index):
+    """
+    Number of items on a page for a (fractional) density per page, spread evenly
+    """
+    return math.floor((page_index + 1) * count_per_page) - math.floor(page_index * count_per_page)
+
+
+def image_png(width, height, color):
+    pix = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, width, height), False)
+    pix.set_rect(pix.irect, color)
+    return pix.tobytes("png")
+
+
+def draw_table(page, y, rows, cols, table_number):
+    x0 = 72
+    col_width = 440 / cols
+    for r in range(rows + 1):
+        page.draw_line((x0, y + r * 15), (x0 + cols * col_width, y + r * 15))
+    for c in range(cols + 1):
+        page.draw_line((x0 + c * col_width, y), (x0 + c * col_width, y + rows * 15))
+    for r in range(rows):
+        for c in range(cols):
+            page.insert_text((x0 + c * col_width + 4, y + r * 15 + 11), f"t{table_number} r{r} c{c}", fontsize=8)
+    return y + rows * 15 + 10
+
+
+def make_spec_pdf(output_file, pages=100, sections_per_page=1.5, toc_entries=60, tables_per_page=0.25,
+                  images_per_page=0.5, seed=0):
+    """
+    Write a deterministic spec like PDF: a cover page, the table of contents and
+    the body pages holding numbered section headings, body text paragraphs,
+    ruled tables and figure images, with a header (and logo) and a footer on
+    every page. The body ends with an annex.
+
+    Returns the layout of the document (page count, TOC page range and the
+    number of sections, tables and images).
+    """
+    rng = random.Random(seed)
+    toc_pages = math.ceil(toc_entries / TOC_LINES_PER_PAGE)
+    body_pages = max(pages - 1 - toc_pages, 1)
+    annex_start = body_pages - max(body_pages // 10, 1)
+    logo = image_png(20, 20, (200, 200, 200))
+
+    doc = pymupdf.open()
+    cover = doc.new_page()
+    cover.insert_text((72, 300), "Synthetic specification", fontsize=24)
+
+    for toc_page in range(toc_pages):
+        page = doc.new_page()
+        first = toc_page * TOC_LINES_PER_PAGE + 1
+        for line, entry in enumerate(range(first, min(first + TOC_LINES_PER_PAGE, toc_entries + 1))):
+            page.insert_text((72, BODY_TOP + line * 14), f"{entry} Section title {entry} {'.' * 30} {entry + toc_pages + 1}", fontsize=10)
+
+    section = [0, 0]
+    counts = {'sections': 0, 'tables': 0, 'images': 0}
+    for body_page in range(body_pages):
+        page = doc.new_page()
+        page_number = doc.page_count
+        page.insert_text((72, 30), f"Rec. synthetic page {page_number}", fontsize=9)
+        page.insert_image(pymupdf.Rect(500, 20, 520, 40), stream=logo)
+
+        items = ['heading'] * spread(sections_per_page, body_page)
+        items += ['table'] * spread(tables_per_page, body_page)
+        items += ['image'] * spread(images_per_page, body_page)
+        rng.shuffle(items)
+
+        y = BODY_TOP
+        if body_page == 0:
+            page.insert_text((72, y), TITLE, fontsize=14)
+            y += 24
+        if body_page == annex_start:
+            page.insert_text((72, y), "Annex A", fontsize=14)
+            y += 24
+            section = [0, 0]
+
+        while y < BODY_BOTTOM - 80:
+            item = items.pop() if items else 'text'
+            if item == 'heading':
+                if section[0] == 0 or rng.random() < 0.3:
+                    section = [section[0] + 1, 0]
+                else:
+                    section[1] += 1
+                number = f"{section[0]}" if section[1] == 0 else f"{section[0]}.{section[1]}"
+                if body_page >= annex_start:
+                    number = f"A.{number}"
+                page.insert_text((72, y + 12), f"{number} Heading {number}", fontsize=12, fontname="helv")
+                y += 20
+                counts['sections'] += 1
+            elif item == 'table':
+                counts['tables'] += 1
+                y = draw_table(page, y, rng.randint(2, 4), rng.randint(2, 4), counts['tables'])
+            elif item == 'image':
+                counts['images'] += 1
+                # every figure has its own content so that it is extracted as a separate image
+                figure = image_png(40, 30, (counts['images'] % 256, (counts['images'] // 256) % 256, 100))
+                page.insert_image(pymupdf.Rect(72, y, 232, y + 60), stream=figure)
+                y += 70
+            else:
+                text = "Body text lorem ipsum dolor sit amet " * rng.randint(4, 12)
+                page.insert_textbox(pymupdf.Rect(72, y, 520, y + 60), text, fontsize=9, fontname="tiro")
+                y += 66
+
+        page.insert_text((72, 790), f"Footer {page_number}", fontsize=9)
+
+    # no new file id, so the same arguments always give the same bytes
+    doc.save(output_file, no_new_id=True)
+    doc.close()
+
+    return {
+        'pages': 1 + toc_pages + body_pages,
+        'toc_pages': f"2-{toc_pages + 1}" if toc_pages else None,
+        **counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic spec like PDF')
+    parser.add_argument('output_file', help='Output PDF file')
+    parser.add_argument('-p', '--pages', type=int, default=100, help='Number of pages')
+    parser.add_argument('-s', '--sections_per_page', type=float, default=1.5, help='Numbered section headings per body page')
+    parser.add_argument('-t', '--toc_entries', type=int, default=60, help='Number of table of contents entries')
+    parser.add_argument('-tb', '--tables_per_page', type=float, default=0.25, help='Ruled tables per body page')
+    parser.add_argument('-im', '--images_per_page', type=float, default=0.5, help='Figure images per body page (besides the header logo)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the layout')
+    args = parser.parse_args()
+
+    layout = make_spec_pdf(args.output_file, args.pages, args.sections_per_page, args.toc_entries,
+                           args.tables_per_page, args.images_per_page, args.seed)
+    print(f"Wrote {args.output_file}: {layout}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
 import os
 import yaml
 import pymupdf
 import json
 import re
-from blocks.pdf_processor import preprocess_pdf, analyze_pdf
+import sys
+from blocks.pdf_processor import preprocess_pages, analyze_pdf, new_preprocess_result, stream_filtered_pages
+from blocks.page_output import PageOutputWriter, load_pages, select_pages, write_json_pages
+from blocks.page_cache import PageCache
+from blocks.checkpoint import PageCheckpoint
 from blocks.toc_parser import process_toc
+from blocks.section_search import SectionSearchIndex
+from blocks.image_table_extractor import TABLE_DETECTION_MODES
+from blocks.utils import PageSet
+from blocks.records import record_to_dict
+from blocks.profiler import enable_profiling, get_profiler, stage
 
-def parse_arguments():
+def parse_arguments(argv=None):
     """
     Parse command line arguments
     """
@@ -25,12 +35,26 @@ def parse_arguments():
     parser.add_argument('-main', '--main_pages', help='List of page ranges for the main document (e.g., "1-3,5,7-")')
     parser.add_argument('-exclude', '--exclude_pages', help='List of page ranges to exclude (e.g., "4,6,8-10")')
     parser.add_argument('-toc', '--toc_pages', help='List of page ranges for the table of contents (e.g., "2-3")')
+    parser.add_argument('-toconly', '--toc_only', action='store_true', help='Only process the table of contents pages, writing only the TOC page data and table_of_contents.json (e.g. to re-run the TOC parsing)')
     parser.add_argument('-cfg', '--config_file', help='Path to the YAML configuration file')
     parser.add_argument('-skip', '--skip_preprocessing', action='store_true', help='Skip the preprocessing phase and use the filtered data input file')
     parser.add_argument('--filtered_data_file', help='Path to the filtered data input file')
+    parser.add_argument('-ap', '--analyze_pages', help='List of page ranges of the filtered pages to analyze (e.g., "10-20"), only those pages are read from the page data files. The sections are written to <name>_sections_partial.json and section_text_partial, leaving those of a full run as they are')
+    parser.add_argument('-sd', '--start_division', default='default', help='Division type the section analysis starts in (e.g. the division of the first page given with --analyze_pages)')
+    parser.add_argument('-ss', '--start_section', help='Number of the section preceding the analyzed pages, the first section found must follow it')
     parser.add_argument('-tcfg', '--toc_parsing_config', help='TOC parsing configuration to use from the global config file')
     parser.add_argument('-nf', '--nofiles', action='store_true', help='Do not save files at completion')
-    return parser.parse_args()
+    parser.add_argument('-of', '--output_format', choices=['json', 'jsonl', 'pblk'], default='json', help='Write the page data as whole document JSON, or stream it page by page as JSON Lines or as a binary block file')
+    parser.add_argument('-z', '--compress', action='store_true', help='zstd compress the pages of pblk block files (needs the zstandard package)')
+    parser.add_argument('-cache', '--cache_dir', help='Directory of the persistent per-page extraction cache (disabled if not given)')
+    parser.add_argument('--cache_size', type=int, default=1024, help='Maximum size of the page cache in MB')
+    parser.add_argument('-si', '--search_index', help='Add the document\'s sections to this cross-document search index (see search_sections.py)')
+    parser.add_argument('-td', '--table_detection', choices=TABLE_DETECTION_MODES, default='always', help='Run table detection on every page, on no page, or (auto) only on pages with ruling lines')
+    parser.add_argument('-fuse', '--fused', action='store_true', help='Analyze each page as soon as it is extracted instead of after the whole document is preprocessed. With -of json the pages are still all kept in memory to be written at the end, use -of jsonl or pblk to stream them')
+    parser.add_argument('-resume', '--resume', action='store_true', help='Checkpoint each extracted page to checkpoint.jsonl in the output directory and continue from the last checkpointed page of an interrupted run')
+    parser.add_argument('-prof', '--profile', action='store_true', help='Time the stages of the pipeline, saving the stage and per-page times to profile.json and printing a summary')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes used to extract pages in parallel')
+    return parser.parse_args(argv)
 
 
 def load_global_config(config_file):
@@ -73,19 +97,32 @@ def build_regex(config_section):
     return toc_pattern
 
 
-def main():
-    args = parse_arguments()
+def page_output_paths(output_dir_path, input_file, output_format):
+    base_name = os.path.basename(input_file)[:-4]
+    return {
+        'blocks': os.path.join(output_dir_path, f"{base_name}_blocks.{output_format}"),
+        'filtered': os.path.join(output_dir_path, f"filtered_{base_name}_blocks.{output_format}"),
+        'excluded': os.path.join(output_dir_path, f"excluded_{base_name}_blocks.{output_format}"),
+        'toc': os.path.join(output_dir_path, f"toc_{base_name}_blocks.{output_format}"),
+        # locations aren't block data, so block file outputs keep them as JSON Lines
+        'locations': os.path.join(output_dir_path, f"locations.{'jsonl' if output_format == 'pblk' else output_format}"),
+    }
 
-    global_config = load_global_config('config_blk_analysis.yaml')
 
+def apply_config_file(args):
     # Load configuration from YAML file if provided
-    config = {}
     if args.config_file:
         with open(args.config_file, 'r') as f:
             config = yaml.safe_load(f)
-        for key, value in config.items():
+        for key, value in (config or {}).items():
             setattr(args, key, value)
 
+
+def analyze_document(args, global_config):
+    """
+    Preprocess the PDF of args (the parsed command line), parse its table of
+    contents and analyze its sections, returning the sections
+    """
     common_regex = global_config.get('common_regex', {})
 
     toc_parsing_config = global_config.get('toc_parsing_configurations', {}).get(args.toc_parsing_config or 'default', {})
@@ -98,15 +135,25 @@ def main():
 
     output_file = args.output_file if args.output_file else os.path.join(output_dir_path, f"{os.path.basename(args.input_file)[:-4]}_outline.pdf")
 
+    output_paths = page_output_paths(output_dir_path, args.input_file, args.output_format)
+
+    # the sections of a partial analysis (--analyze_pages) don't replace those of a full run
+    partial = "_partial" if args.analyze_pages else ""
+    section_text_dir = os.path.join(output_dir_path, f"section_text{partial}")
+    if not args.toc_only:
+        os.makedirs(section_text_dir, exist_ok=True)
+
+    analysis_config = global_config.get('analysis_config', {})
+    if args.start_division not in analysis_config.get('division_types', {}):
+        raise ValueError(f"Division type '{args.start_division}' is not defined in the configuration file")
+    sections = None
+    checkpoint = None
+
     if args.skip_preprocessing:
-        filtered_data_file = args.filtered_data_file if args.filtered_data_file else os.path.join(output_dir_path, f"filtered_{os.path.basename(args.input_file)[:-4]}_blocks.json")
-        toc_data_file = os.path.join(output_dir_path, f"toc_{os.path.basename(args.input_file)[:-4]}_blocks.json")
-        
-        with open(filtered_data_file, 'r', encoding='utf-8') as f:
-            filtered_pages_data = json.load(f)
-        
-        with open(toc_data_file, 'r', encoding='utf-8') as f:
-            toc_data = json.load(f)
+        filtered_data_file = args.filtered_data_file if args.filtered_data_file else output_paths['filtered']
+
+        filtered_pages_data = load_pages(filtered_data_file) if not args.toc_only else None
+        toc_data = load_pages(output_paths['toc'])
     else:
 
         files = {
@@ -126,57 +173,116 @@ def main():
             'include_pages': args.main_pages,
             'exclude_pages': args.exclude_pages,
             'toc_pages':  args.toc_pages,
+            'toc_only': args.toc_only,
+            'workers': args.workers,
+            'table_detection': args.table_detection,
         }
 
-        # pages_data, filtered_pages_data, toc_data, images, tables, location_info = preprocess_pdf(files, config)
-        result = preprocess_pdf(files, config)
-        filtered_pages_data = result['filtered_pages_data']
-        toc_data = result['toc_data']
-
-        if not args.nofiles:
-            json_output_file = os.path.join(output_dir_path, f"{os.path.basename(args.input_file)[:-4]}_blocks.json")
-            with open(json_output_file, 'w', encoding='utf-8') as f:
-                json.dump(result['pages_data'], f, ensure_ascii=False, indent=4)
-
-            filtered_json_output_file = os.path.join(output_dir_path, f"filtered_{os.path.basename(args.input_file)[:-4]}_blocks.json")
-            with open(filtered_json_output_file, 'w', encoding='utf-8') as f:
-                json.dump(filtered_pages_data, f, ensure_ascii=False, indent=4)
+        page_cache = PageCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+        checkpoint = PageCheckpoint(os.path.join(output_dir_path, "checkpoint.jsonl")) if args.resume else None
+
+        # with jsonl/pblk each page is streamed to the output files as it is extracted,
+        # only the images, tables and toc pages are kept in memory
+        streaming = args.output_format in ('jsonl', 'pblk') and not args.nofiles
+        # with --toc_only only the toc pages are written, the page outputs of
+        # an earlier full run are left as they are
+        outputs = ('toc',) if args.toc_only else None
+        result = new_preprocess_result()
+        with PageOutputWriter(output_paths, args.compress, outputs) if streaming else contextlib.nullcontext() as writer:
+            filtered_pages = stream_filtered_pages(preprocess_pages(files, config, page_cache, checkpoint), result, writer, keep_pages=not streaming)
+            if args.fused and not args.toc_only:
+                # analyze each filtered page as soon as it is extracted, the section
+                # text files are written while the extraction continues
+                if args.analyze_pages:
+                    filtered_pages = select_pages(filtered_pages, PageSet.parse(args.analyze_pages, sys.maxsize))
+                sections = analyze_pdf(filtered_pages, analysis_config, section_text_dir, args.start_division, args.start_section)
+            else:
+                for _ in filtered_pages:
+                    pass
+
+        if page_cache:
+            page_cache.close()
 
-            excluded_json_output_file = os.path.join(output_dir_path, f"excluded_{os.path.basename(args.input_file)[:-4]}_blocks.json")
-            with open(excluded_json_output_file, 'w', encoding='utf-8') as f:
-                json.dump(result['excluded_pages_data'], f, ensure_ascii=False, indent=4)
+        toc_data = result['toc_data']
+        # the streamed filtered pages are read back lazily so memory stays flat
+        filtered_pages_data = load_pages(output_paths['filtered']) if streaming and not args.toc_only else result['filtered_pages_data']
 
-            toc_json_output_file = os.path.join(output_dir_path, f"toc_{os.path.basename(args.input_file)[:-4]}_blocks.json")
-            with open(toc_json_output_file, 'w', encoding='utf-8') as f:
-                json.dump(toc_data, f, ensure_ascii=False, indent=4)
+        if args.toc_only:
+            if not args.nofiles and not streaming:
+                write_json_pages(output_paths['toc'], toc_data)
 
+        elif streaming:
             with open(os.path.join(output_dir_path, "images.json"), "w", encoding="utf-8") as f:
                 json.dump(result['images'], f, ensure_ascii=False, indent=4)
 
             with open(os.path.join(output_dir_path, "tables.json"), "w", encoding="utf-8") as f:
                 json.dump(result['tables'], f, ensure_ascii=False, indent=4)
 
-            with open(os.path.join(output_dir_path, "locations.json"), "w", encoding="utf-8") as f:
-                json.dump(result['location_info'], f, ensure_ascii=False, indent=4)
+        elif not args.nofiles:
+            with stage("json_dump"):
+                # the page data files are written with a page index (.idx) for random access
+                write_json_pages(output_paths['blocks'], result['pages_data'])
+                write_json_pages(output_paths['filtered'], result['filtered_pages_data'])
+                write_json_pages(output_paths['excluded'], result['excluded_pages_data'])
+                write_json_pages(output_paths['toc'], toc_data)
+
+                with open(os.path.join(output_dir_path, "images.json"), "w", encoding="utf-8") as f:
+                    json.dump(result['images'], f, ensure_ascii=False, indent=4)
+
+                with open(os.path.join(output_dir_path, "tables.json"), "w", encoding="utf-8") as f:
+                    json.dump(result['tables'], f, ensure_ascii=False, indent=4)
+
+                with open(output_paths['locations'], "w", encoding="utf-8") as f:
+                    json.dump(result['location_info'], f, ensure_ascii=False, indent=4, default=record_to_dict)
 
     toc_regex_string = build_regex(toc_parsing_config)
     # print("TOC Regex: ", toc_regex_string)
     toc_regex_pattern = re.compile(toc_regex_string)
 
     toc_file_path = os.path.join(output_dir_path, "table_of_contents.json")
-    _ = process_toc(toc_data, toc_file_path, toc_parsing_config, toc_regex_pattern)
+    with stage("toc_parsing"):
+        _ = process_toc(toc_data, toc_file_path, toc_parsing_config, toc_regex_pattern)
 
-    section_text_dir = os.path.join(output_dir_path, "section_text")
-    os.makedirs(section_text_dir, exist_ok=True)
+    if args.toc_only:
+        sections = []
+    elif sections is None:
+        if args.analyze_pages:
+            filtered_pages_data = select_pages(filtered_pages_data, PageSet.parse(args.analyze_pages, sys.maxsize))
 
-    analysis_config = global_config.get('analysis_config', {})
-    sections = analyze_pdf(filtered_pages_data, analysis_config, section_text_dir)
+        sections = analyze_pdf(filtered_pages_data, analysis_config, section_text_dir, args.start_division, args.start_section)
 
-    if not args.nofiles:
-        sections_output_file = os.path.join(output_dir_path, f"{os.path.basename(args.input_file)[:-4]}_sections.json")
-        with open(sections_output_file, 'w', encoding='utf-8') as f:
+    if not args.nofiles and not args.toc_only:
+        sections_output_file = os.path.join(output_dir_path, f"{os.path.basename(args.input_file)[:-4]}_sections{partial}.json")
+        with stage("json_dump"), open(sections_output_file, 'w', encoding='utf-8') as f:
             json.dump(sections, f, ensure_ascii=False, indent=4)
 
+        # only the sections of the whole document are indexed
+        if args.search_index and args.analyze_pages:
+            print(f"Partial analysis, the sections are not added to the search index {args.search_index}")
+        elif args.search_index:
+            with SectionSearchIndex(args.search_index) as index:
+                if index.ingest_document(output_dir_path, output_dir):
+                    print(f"Added {len(sections)} sections to the search index {args.search_index}")
+
+    if checkpoint:
+        # the document is complete, a later --resume run starts over
+        checkpoint.remove()
+
+    if args.profile:
+        get_profiler().report(os.path.join(output_dir_path, "profile.json"))
+
+    return sections
+
+
+def main():
+    args = parse_arguments()
+    if args.profile:
+        enable_profiling()
+
+    global_config = load_global_config('config_blk_analysis.yaml')
+    apply_config_file(args)
+    analyze_document(args, global_config)
+
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,16 @@
 from blocks.utils import normalize_bbox
+from blocks.records import BBox, Block, TextSegment
+from blocks.spatial_index import BBoxIndex
 
 def process_block_text(block):
-    block_data = {
-        "block_number": block["number"],
-        "type": block["type"],
-        "bbox": normalize_bbox(block["bbox"]),
-        "text_segments": []
-    }
+    block_data = Block(block["number"], block["type"], BBox.from_dict(normalize_bbox(block["bbox"])))
+    text_segments = block_data.text_segments
 
     if "lines" in block:
         current_font_size = None
         current_font = None
-        current_text = ""
+        # text of the current segment as a list of parts, joined when the segment ends
+        current_text = []
         prev_line_num = None
         for line in block["lines"]:
             for span in line["spans"]:
@@ -20,39 +19,36 @@ def process_block_text(block):
                 text = span["text"]
                 line_num = span["origin"][1]
                 if text.strip() == "":
-                    current_text += text
+                    current_text.append(text)
                 elif font_size == current_font_size and font == current_font:
                     if prev_line_num is not None and line_num != prev_line_num:
-                        current_text += "\n"
-                    current_text += text
+                        current_text.append("\n")
+                    current_text.append(text)
                 else:
-                    if current_text:
-                        block_data["text_segments"].append({
-                            "font_size": current_font_size,
-                            "font": current_font,
-                            "text": current_text
-                        })
+                    segment_text = "".join(current_text)
+                    if segment_text:
+                        text_segments.append(TextSegment(current_font_size, current_font, segment_text))
                     current_font_size = font_size
                     current_font = font
-                    current_text = text
+                    current_text = [text]
                 prev_line_num = line_num
-        if current_text:
-            block_data["text_segments"].append({
-                "font_size": current_font_size,
-                "font": current_font,
-                "text": current_text
-            })
+        segment_text = "".join(current_text)
+        if segment_text:
+            text_segments.append(TextSegment(current_font_size, current_font, segment_text))
     else:
-        block_data["text_segments"].append({
-            "font_size": None,
-            "font": None,
-            "text": ""
-        })
+        text_segments.append(TextSegment(None, None, ""))
 
     return block_data
 
 
-def check_exclusions(block, page_locations, header_limit, footer_limit):
+def location_index(page_locations):
+    """
+    Spatial indexes of the image and table locations of a page
+    """
+    return BBoxIndex(page_locations["images"]), BBoxIndex(page_locations["tables"])
+
+
+def check_exclusions(block, page_locations, header_limit, footer_limit, page_location_index=None):
     block_bbox = block["bbox"]
     block_top = block_bbox['top']
     block_bottom = block_bbox['bottom']
@@ -65,21 +61,27 @@ def check_exclusions(block, page_locations, header_limit, footer_limit):
     if block_bottom > footer_limit:
         return {'type': "footer", 'limit': footer_limit},  True
 
+    if page_location_index is None:
+        page_location_index = location_index(page_locations)
+    image_index, table_index = page_location_index
+
     # Check if the block overlaps with any image block
-    for image_location in page_locations["images"]:
-        image_bbox = image_location["bbox"]
-        if overlaps(block_bbox, image_bbox):
-            return {'type': "image", 'image': image_location['file']},  True
+    _, image_location = image_index.first_overlap(block_bbox)
+    if image_location is not None:
+        return {'type': "image", 'image': image_location['file']},  True
 
     # Check if the block overlaps with any table block
-    for table_location in page_locations["tables"]:
-        table_bbox = table_location["bbox"]
-        if overlaps(block_bbox, table_bbox):
-            return {'type': "table", 'image': table_location['file']},  True
+    _, table_location = table_index.first_overlap(block_bbox)
+    if table_location is not None:
+        return {'type': "table", 'image': table_location['file']},  True
 
     return None, False
 
 
-def overlaps(bbox1, bbox2):
-    return bbox1['x0'] < bbox2['x1'] and bbox1['x1'] > bbox2['x0'] and bbox1['top'] < bbox2['bottom'] and bbox1['bottom'] > bbox2['top']
-
+def check_page_exclusions(blocks, page_locations, header_limit, footer_limit):
+    """
+    check_exclusions() for all the blocks of a page, sharing one spatial index
+    of the page's image and table locations
+    """
+    page_location_index = location_index(page_locations)
+    return [check_exclusions(block, page_locations, header_limit, footer_limit, page_location_index) for block in blocks]
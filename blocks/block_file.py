@@ -0,0 +1,217 @@
+import json
+import math
+import mmap
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Binary container of page block data (the blocks, filtered, excluded and toc outputs)
+#
+#   header    magic, version, flags, page count, offsets of the string table and page index
+#   pages     one record per page, each compressed on its own with zstd when FLAG_ZSTD is set
+#   strings   the interned font names
+#   index     (page number, offset, length) of every page record, for random access
+#
+# A page record is the page header followed by its blocks, each block followed by its
+# text segments. Bboxes and font sizes are stored as float32, which is what pymupdf
+# computes them in, so they read back unchanged. Page and block keys beyond the fixed
+# ones (e.g. header_limit or a block's exclusion) are kept as a small JSON object.
+
+MAGIC = b'PBLK'
+VERSION = 1
+FLAG_ZSTD = 1
+
+HEADER = struct.Struct('<4sHHIQQ')
+INDEX_ENTRY = struct.Struct('<iQI')
+LENGTH = struct.Struct('<I')
+PAGE_HEADER = struct.Struct('<iddII')
+BLOCK = struct.Struct('<iB4fII')
+SEGMENT = struct.Struct('<ifI')
+
+PAGE_KEYS = ('page_number', 'blocks', 'height', 'width')
+BLOCK_KEYS = ('block_number', 'type', 'bbox', 'text_segments')
+NO_FONT = -1
+
+
+def _extra(record, keys):
+    extra = {key: value for key, value in record.items() if key not in keys}
+    return json.dumps(extra, ensure_ascii=False).encode() if extra else b''
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("zstd compressed block files need the zstandard package (pip install zstandard)")
+
+
+class BlockFileWriter:
+    """
+    Writes page block data records (as produced by preprocess_pages) to a block file
+    """
+
+    def __init__(self, file_path, compress=False, level=3):
+        self.file_path = file_path
+        self._file = open(file_path, 'wb')
+        self._index = []
+        self._strings = []
+        self._string_ids = {}
+        self._compressor = None
+        if compress:
+            _require_zstandard()
+            self._compressor = zstandard.ZstdCompressor(level=level)
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+
+    def _font_id(self, font):
+        if font is None:
+            return NO_FONT
+        font_id = self._string_ids.get(font)
+        if font_id is None:
+            font_id = len(self._strings)
+            self._string_ids[font] = font_id
+            self._strings.append(font)
+        return font_id
+
+    def encode_page(self, page):
+        parts = []
+        extra = _extra(page, PAGE_KEYS)
+        parts.append(PAGE_HEADER.pack(page['page_number'], page['height'], page['width'], len(page['blocks']), len(extra)))
+        parts.append(extra)
+        for block in page['blocks']:
+            bbox = block['bbox']
+            extra = _extra(block, BLOCK_KEYS)
+            parts.append(BLOCK.pack(block['block_number'], block['type'], bbox['x0'], bbox['top'], bbox['x1'], bbox['bottom'],
+                                    len(block['text_segments']), len(extra)))
+            parts.append(extra)
+            for segment in block['text_segments']:
+                text = segment['text'].encode()
+                font_size = segment['font_size'] if segment['font_size'] is not None else math.nan
+                parts.append(SEGMENT.pack(self._font_id(segment['font']), font_size, len(text)))
+                parts.append(text)
+        return b''.join(parts)
+
+    def write_page(self, page):
+        data = self.encode_page(page)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._index.append((page['page_number'], self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def close(self):
+        if self._file is None:
+            return
+
+        strings_offset = self._file.tell()
+        self._file.write(LENGTH.pack(len(self._strings)))
+        for string in self._strings:
+            data = string.encode()
+            self._file.write(LENGTH.pack(len(data)))
+            self._file.write(data)
+
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+
+        flags = FLAG_ZSTD if self._compressor is not None else 0
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, flags, len(self._index), strings_offset, index_offset))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BlockFileReader:
+    """
+    Reads a block file as a sequence of page dicts, the file is memory mapped
+    and each page is decoded only when it is accessed
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, flags, page_count, strings_offset, index_offset = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not a block file")
+        if version != VERSION:
+            raise ValueError(f"{file_path} has unsupported block file version {version}")
+
+        self._decompressor = None
+        if flags & FLAG_ZSTD:
+            _require_zstandard()
+            self._decompressor = zstandard.ZstdDecompressor()
+
+        self.fonts = []
+        pos = strings_offset
+        (count,) = LENGTH.unpack_from(self._data, pos)
+        pos += LENGTH.size
+        for _ in range(count):
+            (length,) = LENGTH.unpack_from(self._data, pos)
+            pos += LENGTH.size
+            self.fonts.append(self._data[pos:pos + length].decode())
+            pos += length
+
+        self.index = list(INDEX_ENTRY.iter_unpack(self._data[index_offset:index_offset + page_count * INDEX_ENTRY.size]))
+        self.page_numbers = [page_number for page_number, _, _ in self.index]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        _, offset, length = self.index[i]
+        data = self._data[offset:offset + length]
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        return self.decode_page(data)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def decode_page(self, data):
+        fonts = self.fonts
+        unpack_block = BLOCK.unpack_from
+        unpack_segment = SEGMENT.unpack_from
+        page_number, height, width, block_count, extra_length = PAGE_HEADER.unpack_from(data, 0)
+        pos = PAGE_HEADER.size
+        page = {'page_number': page_number, 'blocks': [], 'height': height, 'width': width}
+        if extra_length:
+            page.update(json.loads(data[pos:pos + extra_length]))
+            pos += extra_length
+
+        blocks = page['blocks']
+        for _ in range(block_count):
+            block_number, block_type, x0, top, x1, bottom, segment_count, extra_length = unpack_block(data, pos)
+            pos += BLOCK.size
+            segments = []
+            block = {
+                'block_number': block_number,
+                'type': block_type,
+                'bbox': {'x0': x0, 'top': top, 'x1': x1, 'bottom': bottom},
+                'text_segments': segments,
+            }
+            if extra_length:
+                block.update(json.loads(data[pos:pos + extra_length]))
+                pos += extra_length
+
+            for _ in range(segment_count):
+                font_id, font_size, text_length = unpack_segment(data, pos)
+                pos += SEGMENT.size
+                segments.append({
+                    'font_size': None if font_size != font_size else font_size,
+                    'font': fonts[font_id] if font_id != NO_FONT else None,
+                    'text': data[pos:pos + text_length].decode(),
+                })
+                pos += text_length
+            blocks.append(block)
+
+        return page
@@ -0,0 +1,92 @@
+import itertools
+import json
+import os
+from blocks.records import record_to_dict
+
+
+class PageCheckpoint:
+    """
+    Append-only JSON Lines log of the pages completed by preprocess_pages(), so
+    that an interrupted run can continue from the last committed page
+
+    The first line identifies the run (the input file and the configuration
+    of the extraction), each following line is the committed entry of a page.
+    A log of another run is discarded, as is a partially written last line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        # offset and number of the entries committed by an earlier run
+        self._committed = (0, 0)
+
+    def resume(self, key):
+        """
+        Open the log for the run identified by key (a JSON object) and return
+        the number of entries committed by an earlier run of it, which are
+        then read back one at a time by entries()
+        """
+        key = json.loads(json.dumps(key))
+        count = 0
+        valid_size = 0
+        entries_offset = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                lines = iter(f)
+                first_line = next(lines, b'')
+                if first_line.endswith(b'\n') and _decode(first_line) == key:
+                    valid_size = entries_offset = len(first_line)
+                    for line in lines:
+                        if not line.endswith(b'\n') or _decode(line) is None:
+                            break
+                        count += 1
+                        valid_size += len(line)
+
+        if valid_size:
+            self._file = open(self.path, 'r+b')
+            self._file.truncate(valid_size)
+            self._file.seek(valid_size)
+        else:
+            self._file = open(self.path, 'wb')
+            self._write(key)
+        self._committed = (entries_offset, count)
+        return count
+
+    def entries(self):
+        """
+        Lazily yield the entries counted by resume(), so that replaying a long
+        run never holds more than one of its pages in memory
+        """
+        offset, count = self._committed
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in itertools.islice(f, count):
+                yield json.loads(line)
+
+    def _write(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False, default=record_to_dict).encode() + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def commit(self, entry):
+        self._write(entry)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """
+        Remove the log once the run is complete
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _decode(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
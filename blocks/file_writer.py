@@ -0,0 +1,73 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def write_file(path, data):
+    """
+    Write the file through a temporary file renamed over path, so an
+    interrupted write never leaves a truncated file behind
+    """
+    mode = "wb" if isinstance(data, bytes) else "w"
+    encoding = None if isinstance(data, bytes) else "utf-8"
+    # the same content named file can be written by several workers at once
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class FileWriter:
+    """
+    Writes files in a pool of background threads so page extraction doesn't
+    wait on disk I/O
+
+    At most max_pending writes are queued, write() blocks when the queue is
+    full so a slow disk holds back extraction instead of buffering the whole
+    document in memory. A path is written once per writer, later writes of
+    the same path are ignored (files are named after their content or page).
+    Errors are raised by wait() and flush().
+    """
+
+    def __init__(self, workers=4, max_pending=64):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file_writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = {}
+
+    def _write(self, path, data):
+        try:
+            write_file(path, data)
+        finally:
+            self._slots.release()
+
+    def write(self, path, data):
+        if path in self._futures:
+            return
+        self._slots.acquire()
+        self._futures[path] = self._executor.submit(self._write, path, data)
+
+    def wait(self, paths):
+        """
+        Wait for the writes of paths to complete, raising the error of a failed write
+        """
+        for path in paths:
+            future = self._futures.get(path)
+            if future is not None:
+                future.result()
+
+    def flush(self):
+        done, _ = wait(self._futures.values())
+        for future in done:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
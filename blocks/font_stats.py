@@ -0,0 +1,151 @@
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+from blocks.utils import page_shards, text_map_lines
+
+# pdfplumber document of a worker process, opened once by _init_worker
+_worker_pdf = None
+
+# subset prefix of an embedded font name (e.g. ABCDEF+Arial-Bold)
+SUBSET_PREFIX = re.compile(r'^[A-Z]{6}\+')
+# MuPDF keeps this many chars of a font name (including its subset prefix)
+MUPDF_FONT_NAME_LENGTH = 31
+
+
+def font_key(fontname, size):
+    """
+    (fontname, size) key of a font, the same for a pdfplumber char and for the
+    pymupdf span font/font_size of the block records: the name is cut to the
+    length MuPDF keeps and its subset prefix removed, the size rounded to 0.1
+    """
+    return SUBSET_PREFIX.sub('', fontname[:MUPDF_FONT_NAME_LENGTH]), round(size, 1)
+
+
+def char_font_key(char):
+    return font_key(char.get('fontname', 'Unknown'), char['size'])
+
+
+def line_font_runs(line):
+    """
+    Split a line into runs of text in the same (fontname, size), whitespace
+    doesn't start a new run and is kept in the current one
+
+    Returns a list of [font key, text] runs, the text of leading whitespace
+    goes into the first run.
+    """
+    runs = []
+    pending_text = ""
+    for text, char in line:
+        if char is None or text.isspace():
+            if runs:
+                runs[-1][1] += text
+            else:
+                pending_text += text
+            continue
+
+        key = char_font_key(char)
+        if runs and runs[-1][0] == key:
+            runs[-1][1] += text
+        else:
+            runs.append([key, pending_text + text])
+            pending_text = ""
+    return runs
+
+
+def page_font_stats(page, page_number):
+    """
+    Font runs of every line of a page and the page's (fontname, size) histogram:
+    the number of lines a font is used in and the number of those lines that
+    also use other fonts (partial lines)
+    """
+    histogram = defaultdict(lambda: {'lines': 0, 'partial_lines': 0})
+    lines = []
+    for line in text_map_lines(page):
+        runs = line_font_runs(line)
+        line_fonts = {key for key, text in runs if text.strip()}
+        for key in line_fonts:
+            histogram[key]['lines'] += 1
+            if len(line_fonts) > 1:
+                histogram[key]['partial_lines'] += 1
+        lines.append({'runs': runs, 'fonts': line_fonts})
+
+    return {'page_number': page_number, 'lines': lines, 'histogram': dict(histogram)}
+
+
+def merge_histograms(histograms):
+    merged = defaultdict(lambda: {'lines': 0, 'partial_lines': 0})
+    for histogram in histograms:
+        for key, counts in histogram.items():
+            merged[key]['lines'] += counts['lines']
+            merged[key]['partial_lines'] += counts['partial_lines']
+    return dict(merged)
+
+
+def _init_worker(input_file):
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(input_file)
+
+
+def _page_shard_stats(page_numbers):
+    return [page_font_stats(_worker_pdf.pages[page_number - 1], page_number) for page_number in page_numbers]
+
+
+def iter_page_font_stats(input_file, page_numbers=None, workers=1):
+    """
+    Yield the page_font_stats() of the pages of a PDF in page order, using a
+    pool of worker processes when workers > 1
+    """
+    with pdfplumber.open(input_file) as pdf:
+        if page_numbers is None:
+            page_numbers = list(range(1, len(pdf.pages) + 1))
+
+        if workers <= 1 or len(page_numbers) <= 1:
+            for page_number in page_numbers:
+                page = pdf.pages[page_number - 1]
+                yield page_font_stats(page, page_number)
+                # release the parsed objects of the page as the document is scanned
+                page.close()
+            return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(input_file,)) as executor:
+        for shard_stats in executor.map(_page_shard_stats, page_shards(page_numbers, workers)):
+            yield from shard_stats
+
+
+def document_font_histogram(input_file, page_numbers=None, workers=1):
+    return merge_histograms(page['histogram'] for page in iter_page_font_stats(input_file, page_numbers, workers))
+
+
+def body_font(histogram):
+    """
+    The (fontname, size) used in the most lines, taken to be the body text font
+    """
+    if not histogram:
+        return None
+    return max(histogram, key=lambda key: histogram[key]['lines'])
+
+
+def heading_fonts(histogram, min_lines=1):
+    """
+    Candidate heading fonts: the (fontname, size) keys larger than the body font,
+    or of the body size in another font, used mostly for whole lines
+
+    Returns the keys largest first. They are font_key() keys, so a text
+    segment of the block records is in a heading font when
+    font_key(segment['font'], segment['font_size']) is one of them.
+    """
+    body = body_font(histogram)
+    if body is None:
+        return []
+
+    candidates = []
+    for key, counts in histogram.items():
+        fontname, size = key
+        if key == body or counts['lines'] < min_lines:
+            continue
+        if counts['partial_lines'] * 2 > counts['lines']:
+            continue
+        if size > body[1] or (size == body[1] and fontname != body[0]):
+            candidates.append(key)
+    return sorted(candidates, key=lambda key: (-key[1], -histogram[key]['lines']))
@@ -1,52 +1,148 @@
+import hashlib
 import os
+import time
 from blocks.utils import rect_to_dict
+from blocks.records import BBox, Location
+from blocks.profiler import stage
+from blocks.file_writer import write_file
 from pymupdf.utils import getColor
 
 
-def extract_images_and_tables(doc, page, page_num, output_dir, doc_image_index, doc_table_index):
+def save_file(path, data, file_writer=None):
+    """
+    Write the file in the background through file_writer, or right away if there is none
+    """
+    if file_writer is not None:
+        file_writer.write(path, data)
+    else:
+        write_file(path, data)
+
+
+def write_image(doc, xref, output_dir, file_writer=None):
+    """
+    Decode the image stream xref and write it under a name derived from its
+    content, so identical images are stored once whatever their xref. Returns
+    the file name and size of the image.
+    """
+    base_image = doc.extract_image(xref)
+    image_bytes = base_image["image"]
+    image_filename = f"image_{hashlib.sha256(image_bytes).hexdigest()[:16]}.{base_image['ext']}"
+    image_path = os.path.join(output_dir, image_filename)
+    if not os.path.exists(image_path):
+        save_file(image_path, image_bytes, file_writer)
+    return image_filename, len(image_bytes)
+
+
+class ImageCache:
+    """
+    Files (name and size) of the images of a document already written, by
+    xref, so that an image repeated on many pages (logos, header figures) is
+    decoded only once
+
+    decodes counts the images actually decoded through the cache.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.decodes = 0
+
+    def image_file(self, doc, xref, output_dir, file_writer=None):
+        image_file = self.files.get(xref)
+        if image_file is None:
+            image_file = write_image(doc, xref, output_dir, file_writer)
+            self.files[xref] = image_file
+            self.decodes += 1
+        return image_file
+
+
+# table detection modes: find_tables() on every page, on no page, or only on the pages with ruling lines
+TABLE_DETECTION_MODES = ['always', 'never', 'auto']
+
+
+def has_table_edges(page):
+    """
+    Cheap pre-check for find_tables(): its default "lines" strategy builds
+    cells from the line and rectangle drawings of the page, so a page
+    needs at least four edges to hold a table
+    """
+    edges = 0
+    for path in page.get_drawings():
+        for item in path['items']:
+            if item[0] == 'l':
+                edges += 1
+            elif item[0] in ('re', 'qu'):
+                edges += 4
+            if edges >= 4:
+                return True
+    return False
+
+
+def find_page_tables(page, table_detection='always', timing=None):
+    """
+    Run find_tables() on the page according to the table_detection mode,
+    recording the time of the pre-check and of find_tables() in timing
+    """
+    timing = timing if timing is not None else {}
+    timing.update({'table_detection': table_detection, 'table_check': None, 'find_tables': None})
+
+    if table_detection == 'never':
+        return []
+
+    if table_detection == 'auto':
+        start = time.perf_counter()
+        with stage("table_check"):
+            candidate = has_table_edges(page)
+        timing['table_check'] = time.perf_counter() - start
+        if not candidate:
+            return []
+
+    start = time.perf_counter()
+    with stage("find_tables"):
+        tables = page.find_tables().tables
+    timing['find_tables'] = time.perf_counter() - start
+    return tables
+
+
+def extract_images_and_tables(doc, page, page_num, output_dir, doc_image_index, doc_table_index, image_cache=None,
+                              table_detection='always', timing=None, file_writer=None, image_sizes=None):
+    """
+    Extract the images and tables of a page, the size of each image file is
+    added to image_sizes (by file name) if given
+    """
+    image_sizes = image_sizes if image_sizes is not None else {}
     images = []
     tables = []
     page_locations = {"page": page_num, "images": [], "tables": []}
     # return images, tables, page_locations, doc_image_index, doc_table_index
 
     # Extract images
-    image_list = page.get_images(full=True)
+    with stage("get_images"):
+        image_list = page.get_images(full=True)
     for img_index, img in enumerate(image_list):
         xref = img[0]
-        base_image = doc.extract_image(xref)
-        image_bytes = base_image["image"]
-        image_filename = f"image_p{page_num}_{img_index+1}.png"
-        image_path = os.path.join(output_dir, image_filename)
-        with open(image_path, "wb") as image_file:
-            image_file.write(image_bytes)
-        images.append(image_filename)
+        with stage("extract_image"):
+            if image_cache is not None:
+                image_filename, image_size = image_cache.image_file(doc, xref, output_dir, file_writer)
+            else:
+                image_filename, image_size = write_image(doc, xref, output_dir, file_writer)
+        image_sizes[image_filename] = image_size
+        if image_filename not in images:
+            images.append(image_filename)
         doc_image_index += 1
-        location_record = {
-            "page": page_num,
-            "page_index": img_index+1,
-            "doc_index": doc_image_index,
-            "bbox": rect_to_dict(page.get_image_bbox(img)),
-            "file": image_filename
-        }
+        location_record = Location(page_num, img_index+1, doc_image_index, BBox.from_dict(rect_to_dict(page.get_image_bbox(img))), image_filename)
         page_locations["images"].append(location_record)
 
     # Extract tables
-    tables_on_page = page.find_tables()
+    tables_on_page = find_page_tables(page, table_detection, timing)
     for table_index, table in enumerate(tables_on_page):
-        table_text = table.extract()
+        with stage("extract_table"):
+            table_text = table.extract()
         table_filename = f"table_p{page_num}_{table_index+1}.txt"
         table_path = os.path.join(output_dir, table_filename)
-        with open(table_path, "w", encoding="utf-8") as table_file:
-            table_file.write(str(table_text))
+        save_file(table_path, str(table_text), file_writer)
         tables.append(table_filename)
         doc_table_index += 1
-        location_record = {
-            "page": page_num,
-            "page_index": table_index+1,
-            "doc_index": doc_table_index,
-            "bbox": rect_to_dict(table.bbox),
-            "file": table_filename
-        }
+        location_record = Location(page_num, table_index+1, doc_table_index, BBox.from_dict(rect_to_dict(table.bbox)), table_filename)
         page_locations["tables"].append(location_record)
 
     return images, tables, page_locations, doc_image_index, doc_table_index
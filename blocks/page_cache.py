@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+from blocks.records import Block, Location, record_to_dict
+
+
+def font_hash(doc, xref):
+    """
+    Hash of the embedded font file of the font xref (empty for a font that is not embedded)
+    """
+    return hashlib.sha256(doc.extract_font(xref)[3]).digest()
+
+
+def page_hash(doc, page, font_hashes=None):
+    """
+    Hash of the content of a page: its content stream, fonts (including their
+    embedded font files), page size and the raw streams of its images and form
+    xobjects. xref numbers are left out so that identical pages of different
+    revisions of a document hash the same
+
+    font_hashes (a dict by font xref) keeps the font file hashes of a document
+    so that a font used on many pages is hashed once.
+    """
+    font_hashes = font_hashes if font_hashes is not None else {}
+    h = hashlib.sha256()
+    h.update(repr(tuple(page.rect)).encode())
+    h.update(page.read_contents())
+    for font in page.get_fonts():
+        h.update(repr(font[1:]).encode())
+        if font[0] not in font_hashes:
+            font_hashes[font[0]] = font_hash(doc, font[0])
+        h.update(font_hashes[font[0]])
+    for img in page.get_images(full=True):
+        h.update(repr(img[2:]).encode())
+        h.update(doc.xref_stream_raw(img[0]) or b'')
+    for xobj in page.get_xobjects():
+        h.update(doc.xref_stream_raw(xobj[0]) or b'')
+    return h.hexdigest()
+
+
+class PageCache:
+    """
+    Persistent on-disk cache of extracted page records
+
+    Each entry is a directory holding the page record as JSON along with the
+    image and table files written for the page. Entries are evicted least
+    recently used first when the cache grows beyond max_size bytes.
+    """
+
+    RECORD_FILE = 'record.json'
+    # put() evicts down to this fraction of max_size, so the cache directory
+    # is scanned once per this much new data rather than on every store
+    EVICT_TARGET = 0.9
+
+    def __init__(self, cache_dir, max_size=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        # approximate size of the cache, None until the first eviction scan
+        self.size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, page_num, extractor_version, config):
+        key_fields = [content_hash, page_num, extractor_version, config['header_size'], config['footer_size'],
+                      config.get('table_detection', 'always')]
+        return hashlib.sha256(json.dumps(key_fields).encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._entry_dir(key), self.RECORD_FILE))
+
+    def missing(self, keys):
+        """
+        Return the keys that are not in the cache, counting each as a miss
+        """
+        missing_keys = [key for key in keys if key not in self]
+        self.stats['misses'] += len(missing_keys)
+        return missing_keys
+
+    def get(self, key, output_dir):
+        """
+        Return the cached page record for key (or None), restoring the page's
+        image and table files into output_dir
+        """
+        entry_dir = self._entry_dir(key)
+        record_file = os.path.join(entry_dir, self.RECORD_FILE)
+        try:
+            with open(record_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            for filename in cached['images'] + cached['tables']:
+                shutil.copyfile(os.path.join(entry_dir, filename), os.path.join(output_dir, filename))
+        except (OSError, ValueError):
+            self.stats['misses'] += 1
+            return None
+
+        # the modification time of the record tracks the last use of the entry
+        os.utime(record_file)
+        self.stats['hits'] += 1
+
+        # blocks are shared between page_data and the included/excluded lists,
+        # so only page_data is stored and the lists are rebuilt from it
+        page_data = cached['page_data']
+        page_data['blocks'] = [Block.from_dict(block) for block in page_data['blocks']]
+        locations = cached['locations']
+        locations['images'] = [Location.from_dict(location) for location in locations['images']]
+        locations['tables'] = [Location.from_dict(location) for location in locations['tables']]
+        return {
+            'page_number': page_data['page_number'],
+            'page_data': page_data,
+            'included': [block for block in page_data['blocks'] if 'exclusion' not in block],
+            'excluded': [block for block in page_data['blocks'] if 'exclusion' in block],
+            'images': cached['images'],
+            'image_sizes': {filename: os.path.getsize(os.path.join(output_dir, filename)) for filename in cached['images']},
+            'tables': cached['tables'],
+            'locations': locations,
+        }
+
+    def put(self, key, page_record, output_dir):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        for filename in page_record['images'] + page_record['tables']:
+            shutil.copyfile(os.path.join(output_dir, filename), os.path.join(tmp_dir, filename))
+
+        cached = {
+            'page_data': page_record['page_data'],
+            'images': page_record['images'],
+            'tables': page_record['tables'],
+            'locations': page_record['locations'],
+        }
+        with open(os.path.join(tmp_dir, self.RECORD_FILE), 'w', encoding='utf-8') as f:
+            json.dump(cached, f, ensure_ascii=False, default=record_to_dict)
+
+        entry_size = sum(entry.stat().st_size for entry in os.scandir(tmp_dir))
+
+        # move the completed entry into place so a crashed run never leaves a partial entry
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        self.stats['stores'] += 1
+
+        if self.size is not None:
+            self.size += entry_size
+        if self.size is None or self.size > self.max_size:
+            self.evict(int(self.max_size * self.EVICT_TARGET))
+
+    def evict(self, target_size=None):
+        """
+        Remove the least recently used entries until the cache fits in
+        target_size (max_size by default)
+        """
+        target_size = self.max_size if target_size is None else target_size
+        entries = []
+        total_size = 0
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, self.RECORD_FILE))
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                except OSError:
+                    continue
+                entries.append((last_used, size, entry_dir))
+                total_size += size
+
+        for last_used, size, entry_dir in sorted(entries):
+            if total_size <= target_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            self.stats['evictions'] += 1
+
+        self.size = total_size
+        return total_size
+
+    def close(self):
+        cache_size = self.evict()
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = 100 * self.stats['hits'] / lookups if lookups else 0
+        print(f"Page cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.stats['stores']} stored, {self.stats['evictions']} evicted, {cache_size / (1024 * 1024):.1f} MB in {self.cache_dir}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,262 @@
+import json
+import mmap
+import os
+import re
+import struct
+import textwrap
+from blocks.block_file import BlockFileReader, BlockFileWriter, INDEX_ENTRY
+from blocks.records import record_to_dict
+
+# page record entry -> output file written for it
+PAGE_OUTPUTS = {
+    'page_data': 'blocks',
+    'filtered_page_data': 'filtered',
+    'excluded_page_data': 'excluded',
+    'toc_page_data': 'toc',
+    'locations': 'locations',
+}
+
+# Page index written next to a JSON or JSON Lines page data file (<file>.idx):
+# the size and modification time (ns) of the data file it was written for,
+# then the (page number, offset, length) entries of the pages (the same
+# entries as the index of a block file)
+INDEX_MAGIC = b'PIDX'
+INDEX_HEADER = struct.Struct('<4sQq')
+
+PAGE_NUMBER_PATTERN = re.compile(rb'\{"(?:page_number|page)": (-?\d+)')
+
+
+def read_jsonl(file_path):
+    """
+    Lazily yield the records of a JSON Lines file, one per line
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_page_number(record):
+    # the locations records number their page as 'page'
+    return record.get('page_number', record.get('page', -1))
+
+
+def index_path(file_path):
+    return file_path + '.idx'
+
+
+def write_page_index(file_path, index):
+    """
+    Write the page index of file_path, which must be complete and closed
+    """
+    stat = os.stat(file_path)
+    with open(index_path(file_path), 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns))
+        for entry in index:
+            f.write(INDEX_ENTRY.pack(*entry))
+
+
+def read_page_index(file_path):
+    """
+    The (page number, offset, length) entries of the page index of a JSON or
+    JSON Lines file, None if there is no index or it is out of date
+    """
+    try:
+        with open(index_path(file_path), 'rb') as f:
+            data = f.read()
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    if len(data) < INDEX_HEADER.size:
+        return None
+    # a data file rewritten to the same size still has another modification time
+    magic, indexed_size, indexed_mtime = INDEX_HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC or (indexed_size, indexed_mtime) != (stat.st_size, stat.st_mtime_ns) or \
+            (len(data) - INDEX_HEADER.size) % INDEX_ENTRY.size:
+        return None
+    return list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:]))
+
+
+def scan_json_lines(data):
+    """
+    Build the page index of JSON Lines data by scanning it for the line breaks
+    """
+    index = []
+    offset = 0
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        if end == -1:
+            end = len(data)
+        if data[offset:end].strip():
+            match = PAGE_NUMBER_PATTERN.match(data, offset, end)
+            index.append((int(match.group(1)) if match else -1, offset, end - offset))
+        offset = end + 1
+    return index
+
+
+class PageSequence:
+    """
+    Memory maps a JSON or JSON Lines page data file and decodes each page only
+    when it is accessed, using the file's page index (a JSON Lines file without
+    one is scanned for its lines)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.index = read_page_index(file_path)
+        if self.index is None and not file_path.endswith('.jsonl'):
+            raise ValueError(f"{file_path} has no page index")
+
+        with open(file_path, 'rb') as f:
+            # mmap can't map an empty file
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        if self.index is None:
+            self.index = scan_json_lines(self._data)
+        self.page_numbers = [page_number for page_number, _, _ in self.index]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        _, offset, length = self.index[i]
+        return json.loads(self._data[offset:offset + length])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PageView:
+    """
+    The pages at the given positions of a page sequence
+    """
+
+    def __init__(self, pages, positions):
+        self._pages = pages
+        self._positions = positions
+        self.page_numbers = [pages.page_numbers[i] for i in positions]
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._pages[j] for j in self._positions[i]]
+        return self._pages[self._positions[i]]
+
+    def __iter__(self):
+        for i in self._positions:
+            yield self._pages[i]
+
+
+def select_pages(pages, page_set):
+    """
+    The pages of page_set (a PageSet), only those pages are decoded from a
+    page sequence or block file
+    """
+    page_numbers = getattr(pages, 'page_numbers', None)
+    if page_numbers is not None:
+        return PageView(pages, [i for i, page_number in enumerate(page_numbers) if page_number in page_set])
+    if isinstance(pages, list):
+        return [page for page in pages if page['page_number'] in page_set]
+    return (page for page in pages if page['page_number'] in page_set)
+
+
+def load_pages(file_path):
+    """
+    Load page data from a block file, a JSON Lines file or an indexed JSON list
+    (all read lazily, see PageSequence) or else a JSON list
+    """
+    if file_path.endswith('.pblk'):
+        return BlockFileReader(file_path)
+
+    if file_path.endswith('.jsonl') or read_page_index(file_path) is not None:
+        return PageSequence(file_path)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json_pages(file_path, pages):
+    """
+    Write pages as an indented JSON list (the same as json.dump with indent=4)
+    along with its page index
+    """
+    index = []
+    offset = 0
+    with open(file_path, 'wb') as f:
+        for i, page in enumerate(pages):
+            separator = b'[\n' if i == 0 else b',\n'
+            data = textwrap.indent(json.dumps(page, ensure_ascii=False, indent=4, default=record_to_dict), '    ').encode()
+            index.append((record_page_number(page), offset + len(separator), len(data)))
+            f.write(separator)
+            f.write(data)
+            offset += len(separator) + len(data)
+        end = b'\n]' if index else b'[]'
+        f.write(end)
+    write_page_index(file_path, index)
+
+
+class JsonLinesWriter:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'wb')
+        self._index = []
+        self._offset = 0
+
+    def write_page(self, page):
+        data = json.dumps(page, ensure_ascii=False, default=record_to_dict).encode()
+        self._index.append((record_page_number(page), self._offset, len(data)))
+        self._file.write(data)
+        self._file.write(b'\n')
+        self._offset += len(data) + 1
+        # flush so that downstream tools can consume the pages while extraction continues
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        write_page_index(self.file_path, self._index)
+
+
+def page_writer(file_path, compress=False):
+    if file_path.endswith('.pblk'):
+        return BlockFileWriter(file_path, compress)
+    return JsonLinesWriter(file_path)
+
+
+class PageOutputWriter:
+    """
+    Writes each page record produced by preprocess_pages to the JSON Lines
+    (or block file) outputs as soon as the page has been extracted
+
+    Only the outputs named in outputs are written, all of them by default.
+    """
+
+    def __init__(self, output_paths, compress=False, outputs=None):
+        outputs = PAGE_OUTPUTS.values() if outputs is None else outputs
+        self._writers = {name: page_writer(output_paths[name], compress) for name in outputs}
+
+    def write(self, page_record):
+        for key, name in PAGE_OUTPUTS.items():
+            if page_record[key] is None or name not in self._writers:
+                continue
+            self._writers[name].write_page(page_record[key])
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
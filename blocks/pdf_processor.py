@@ -1,27 +1,246 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from tqdm import tqdm
-from blocks.block_extractor import process_block_text, check_exclusions
-from blocks.image_table_extractor import extract_images_and_tables
-from blocks.utils import parse_page_ranges, dict_to_rect
+from blocks.block_extractor import process_block_text, check_page_exclusions
+from blocks.image_table_extractor import extract_images_and_tables, ImageCache
+from blocks.utils import PageSet, dict_to_rect, page_shards
 from blocks.segments import SegmentAnalyzer
+from blocks.page_cache import PageCache, page_hash
+from blocks.file_writer import FileWriter
+from blocks.profiler import enable_profiling, get_profiler, stage
 import pymupdf
 from pymupdf.utils import getColor  
 from blocks.table_extractor import extract_tables
 from blocks.image_extractor import extract_images
 
 
-def preprocess_pdf(files, config):
+# Version of the page extraction output, bump when extract_page() output changes
+# so that page cache entries of older versions are no longer used
+EXTRACTOR_VERSION = 2
+
+# Version of the checkpoint entries, bump when they change so that checkpoints
+# of older versions are not resumed
+CHECKPOINT_VERSION = 2
+
+# configuration the page records depend on, a checkpoint of a run with other values is not resumed
+CHECKPOINT_CONFIG_KEYS = ('header_size', 'footer_size', 'include_pages', 'exclude_pages', 'toc_pages', 'toc_only', 'table_detection')
+
+
+def extract_page(doc, page, page_num, config, output_dir, image_cache=None, file_writer=None):
     """
-    Process PDF to outline blocks and extract text details
+    Extract the blocks, images and tables of a single page
+
+    Image and table doc_index values are numbered from 1 within the page,
+    number_page_locations() converts them to the document wide numbering.
+    Images already written through image_cache are not decoded again, the
+    image and table files are written in the background by file_writer if given.
+    When profiling, the record's profile holds the stage times of the page.
+    The record's image_decodes is the number of images decoded for the page
+    and its image_sizes the size of each of its image files.
+    """
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.begin_page()
+    decodes = image_cache.decodes if image_cache is not None else 0
+
+    table_timing = {}
+    image_sizes = {}
+    page_images, page_tables, page_locations, _, _ = extract_images_and_tables(
+        doc, page, page_num, output_dir, 0, 0, image_cache, config.get('table_detection', 'always'), table_timing,
+        file_writer, image_sizes)
+
+    with stage("get_text"):
+        page_info = page.get_text("dict")
+    blocks = page_info["blocks"]
+    header_limit = config['header_size'] * page_info['height']
+    footer_limit = (1 - config['footer_size']) * page_info['height']
+    page_included = []
+    page_excluded = []
+    page_data = {
+        "page_number": page_num,
+        "blocks": [],
+        'height': page_info['height'],
+        'width': page_info['width'],
+        'header_limit': header_limit,
+        'footer_limit': footer_limit,
+    }
+
+    with stage("process_block_text"):
+        page_data["blocks"] = [process_block_text(block) for block in blocks]
+    with stage("check_exclusions"):
+        exclusions = check_page_exclusions(page_data["blocks"], page_locations, header_limit, footer_limit)
+
+    for block_data, (exclusion_reason, is_excluded) in zip(page_data["blocks"], exclusions):
+        if is_excluded:
+            block_data['exclusion'] = exclusion_reason
+            page_excluded.append(block_data)
+
+        else:
+            page_included.append(block_data)
+
+    return {
+        'page_number': page_num,
+        'page_data': page_data,
+        'included': page_included,
+        'excluded': page_excluded,
+        'images': page_images,
+        'image_sizes': image_sizes,
+        'tables': page_tables,
+        'locations': page_locations,
+        'table_timing': table_timing,
+        'image_decodes': image_cache.decodes - decodes if image_cache is not None else len(page_locations['images']),
+        'profile': profiler.end_page() if profiler is not None else None,
+    }
+
+
+def number_page_locations(page_locations, doc_image_index, doc_table_index):
+    """
+    Offset the page relative doc_index of each image and table location by the
+    number of images and tables on the preceding pages
+    """
+    for img in page_locations['images']:
+        img['doc_index'] += doc_image_index
+    for tbl in page_locations['tables']:
+        tbl['doc_index'] += doc_table_index
+
+    return doc_image_index + len(page_locations['images']), doc_table_index + len(page_locations['tables'])
+
+
+def outline_page(page, page_record, config):
+    if config['outline_images']:
+        for img in page_record['locations']['images']:
+            rect = dict_to_rect(img["bbox"])
+            page.draw_rect(rect, color=getColor('orange'), width=2)
+
+    if config['outline_tables']:
+        for tbl in page_record['locations']['tables']:
+            rect = dict_to_rect(tbl["bbox"])
+            page.draw_rect(rect, color=getColor('green'), width=2)
+
+    if config['outline_blocks']:
+        for block in page_record['page_data']['blocks']:
+            rect = dict_to_rect(block["bbox"])
+            page.draw_rect(rect, color=(1, 0, 0), width=2)
+
+
+# pymupdf document handle, image cache and file writer of a worker process, created once by _init_worker
+_worker_doc = None
+_worker_image_cache = None
+_worker_file_writer = None
+
+
+def _init_worker(input_file, profile=False):
+    global _worker_doc, _worker_image_cache, _worker_file_writer
+    if profile:
+        enable_profiling()
+    _worker_doc = pymupdf.open(input_file)
+    _worker_image_cache = ImageCache()
+    _worker_file_writer = FileWriter()
+
+
+def _extract_page_shard(page_numbers, config, output_dir):
+    records = [extract_page(_worker_doc, _worker_doc.load_page(page_num - 1), page_num, config, output_dir,
+                            _worker_image_cache, _worker_file_writer)
+               for page_num in page_numbers]
+    # the files of the shard's pages must be on disk by the time the records are returned
+    _worker_file_writer.flush()
+    return records
+
+
+def _extract_pages(mu_doc, input_file, page_numbers, config, output_dir, file_writer=None):
+    workers = config.get('workers') or 1
+    if workers <= 1 or len(page_numbers) <= 1:
+        image_cache = ImageCache()
+        for page_num in page_numbers:
+            yield extract_page(mu_doc, mu_doc.load_page(page_num - 1), page_num, config, output_dir, image_cache, file_writer)
+        return
+
+    shards = page_shards(page_numbers, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(input_file, get_profiler() is not None)) as executor:
+        for shard_records in executor.map(_extract_page_shard, shards, repeat(config), repeat(output_dir)):
+            yield from shard_records
+
+
+def iter_page_records(mu_doc, input_file, page_numbers, config, output_dir, page_cache=None, file_writer=None):
+    """
+    Yield the extracted record of each page in page order, using a pool of
+    worker processes (each with its own pymupdf handle) when config['workers'] > 1
+
+    When a page_cache is given, only the pages missing from it are extracted.
+    With a file_writer, the files of a yielded page may still be being written.
+    """
+    if page_cache is None:
+        yield from _extract_pages(mu_doc, input_file, page_numbers, config, output_dir, file_writer)
+        return
+
+    font_hashes = {}
+    page_keys = {page_num: PageCache.make_key(page_hash(mu_doc, mu_doc.load_page(page_num - 1), font_hashes), page_num,
+                                              EXTRACTOR_VERSION, config)
+                 for page_num in page_numbers}
+    missing_keys = set(page_cache.missing(page_keys.values()))
+    missing_pages = [page_num for page_num in page_numbers if page_keys[page_num] in missing_keys]
+    extracted_records = _extract_pages(mu_doc, input_file, missing_pages, config, output_dir, file_writer)
+
+    for page_num in page_numbers:
+        key = page_keys[page_num]
+        if key in missing_keys:
+            page_record = next(extracted_records)
+            if file_writer is not None:
+                file_writer.wait(page_file_paths(page_record, output_dir))
+            page_cache.put(key, page_record, output_dir)
+        else:
+            page_record = page_cache.get(key, output_dir)
+            if page_record is None:
+                page_record = extract_page(mu_doc, mu_doc.load_page(page_num - 1), page_num, config, output_dir)
+                page_cache.put(key, page_record, output_dir)
+        yield page_record
+
+
+def page_file_paths(page_record, output_dir):
+    return [os.path.join(output_dir, filename) for filename in page_record['images'] + page_record['tables']]
+
+
+def report_table_timing(table_timings, output_dir, file_name="table_timing.json"):
+    """
+    Save the per-page table detection timing to file_name and print a summary
+    """
+    with open(os.path.join(output_dir, file_name), "w", encoding="utf-8") as f:
+        json.dump(table_timings, f, ensure_ascii=False, indent=4)
+
+    checked = [timing for timing in table_timings if timing['table_check'] is not None]
+    searched = [timing for timing in table_timings if timing['find_tables'] is not None]
+    check_time = sum(timing['table_check'] for timing in checked)
+    find_time = sum(timing['find_tables'] for timing in searched)
+    print(f"Table detection ({table_timings[0]['table_detection']}): find_tables on {len(searched)} of {len(table_timings)} pages "
+          f"({find_time:.2f}s), pre-check on {len(checked)} pages ({check_time:.2f}s)")
+
+
+def checkpoint_key(input_file, config):
+    stat = os.stat(input_file)
+    return {
+        'input_file': os.path.abspath(input_file),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'extractor_version': EXTRACTOR_VERSION,
+        'checkpoint_version': CHECKPOINT_VERSION,
+        'config': {key: config.get(key) for key in CHECKPOINT_CONFIG_KEYS},
+    }
+
+
+def preprocess_pages(files, config, page_cache=None, checkpoint=None):
+    """
+    Process PDF to outline blocks and extract text details, yielding a record
+    for each processed page as soon as it has been extracted
+
+    The filtered/excluded/toc entries of a record are None for pages that
+    are not part of that output. With a checkpoint (a PageCheckpoint), each
+    page is committed to it once its files are written, and the pages committed
+    by an earlier run of the same document are replayed instead of extracted.
     """
-    images = []
-    tables = []
-    location_info = []
     doc_image_index = 0
     doc_table_index = 0
-    pages_data = []
-    filtered_pages_data = []
-    excluded_pages_data = []
-    toc_data = []
 
     mu_doc = pymupdf.open(files['input'])
 
@@ -36,106 +255,212 @@ def preprocess_pdf(files, config):
 #            locations[page_num] = data
 
     total_pages = len(mu_doc)
-    main_page_numbers = parse_page_ranges(config['include_pages'], total_pages)
-    exclude_page_numbers = parse_page_ranges(config['exclude_pages'], total_pages, default_range=[])
-    toc_page_numbers = parse_page_ranges(config['toc_pages'], total_pages, default_range=[])
-
-    with tqdm(total=total_pages, desc="Processing Pages", unit="page") as pbar:
-        for page_num, page in enumerate(mu_doc, start=1):
-            if page_num not in main_page_numbers and page_num not in toc_page_numbers:
-                continue
-
-            page_images, page_tables, page_locations, doc_image_index, doc_table_index = extract_images_and_tables(
-                mu_doc, page, page_num, files['output_dir'], doc_image_index, doc_table_index)
-
-            images.extend(page_images)
-            tables.extend(page_tables)
-            location_info.append(page_locations)
-
-            if config['outline_images']:
-                for img in page_locations['images']:
-                    rect = dict_to_rect(img["bbox"])
-                    page.draw_rect(rect, color=getColor('orange'), width=2)
-
-            if config['outline_tables']:
-                for tbl in page_locations['tables']:
-                    rect = dict_to_rect(tbl["bbox"])
-                    page.draw_rect(rect, color=getColor('green'), width=2)
-
-            page_info = page.get_text("dict")
-            blocks = page_info["blocks"]
-            header_limit = config['header_size'] * page_info['height']
-            footer_limit = (1 - config['footer_size']) * page_info['height']
-            page_included = []
-            page_excluded = []
-            page_data = {
-                "page_number": page_num,
-                "blocks": [],
-                'height': page_info['height'],
-                'width': page_info['width'],
-                'header_limit': header_limit,
-                'footer_limit': footer_limit,
-            }
-
-            for block in blocks:
-                block_data = process_block_text(block)
-                page_data["blocks"].append(block_data)
-
-                exclusion_reason, is_excluded = check_exclusions(block_data, page_locations, header_limit, footer_limit)
-                if is_excluded:
-                    block_data['exclusion'] = exclusion_reason
-                    page_excluded.append(block_data)
+    # only the selected pages are ever loaded, pages outside of them are skipped without being touched
+    main_page_numbers = PageSet.parse(config['include_pages'], total_pages)
+    exclude_page_numbers = PageSet.parse(config['exclude_pages'], total_pages, default_all=False)
+    toc_page_numbers = PageSet.parse(config['toc_pages'], total_pages, default_all=False)
+
+    # with toc_only the main pages (even when given) are not extracted
+    page_numbers = list(toc_page_numbers) if config.get('toc_only') else list(main_page_numbers | toc_page_numbers)
+
+    # image file -> size of the images written so far, repeated images are only listed once
+    image_sizes = {}
+    image_occurrences = 0
+    # images decoded by extract_page, in this process or in the workers
+    image_decodes = 0
+    bytes_saved = 0
+    # table detection timing of every extracted page (pages restored from the page cache have none)
+    table_timings = []
+
+    # image and table files are written in the background while the next pages are extracted
+    file_writer = FileWriter()
+
+    committed = checkpoint.resume(checkpoint_key(files['input'], config)) if checkpoint is not None else 0
+    if committed:
+        print(f"Resuming after page {page_numbers[committed - 1]}, {committed} pages restored from {checkpoint.path}")
+
+    with tqdm(total=len(page_numbers), desc="Processing Pages", unit="page") as pbar:
+        # the committed pages are read back from the checkpoint one at a time
+        for entry in checkpoint.entries() if committed else ():
+            output_record = entry['record']
+            doc_image_index = entry['doc_image_index']
+            doc_table_index = entry['doc_table_index']
+            image_occurrences = entry['image_occurrences']
+            image_decodes = entry['image_decodes']
+            bytes_saved = entry['bytes_saved']
+            image_sizes.update(entry['image_sizes'])
+            if entry['table_timing']:
+                table_timings.append(entry['table_timing'])
+
+            outline_page(mu_doc.load_page(output_record['page_number'] - 1), output_record, config)
+            yield output_record
+            pbar.update(1)
 
+        page_records = iter_page_records(mu_doc, files['input'], page_numbers[committed:], config, files['output_dir'],
+                                         page_cache, file_writer)
+        for page_record in page_records:
+            page_num = page_record['page_number']
+            page_data = page_record['page_data']
+
+            doc_image_index, doc_table_index = number_page_locations(
+                page_record['locations'], doc_image_index, doc_table_index)
+
+            with stage("outline_page", page_num):
+                outline_page(mu_doc.load_page(page_num - 1), page_record, config)
+
+            profiler = get_profiler()
+            if profiler is not None and page_record.get('profile'):
+                profiler.add_page(page_num, page_record['profile'])
+
+            page_timing = None
+            if page_record.get('table_timing'):
+                page_timing = {'page_number': page_num, **page_record['table_timing']}
+                table_timings.append(page_timing)
+
+            # pages restored from the page cache decoded no image
+            image_decodes += page_record.get('image_decodes', 0)
+            new_images = []
+            for image in page_record['locations']['images']:
+                image_occurrences += 1
+                if image['file'] in image_sizes:
+                    bytes_saved += image_sizes[image['file']]
                 else:
-                    page_included.append(block_data)
-
-                if config['outline_blocks']:
-                    rect = pymupdf.Rect(block["bbox"])
-                    page.draw_rect(rect, color=(1, 0, 0), width=2)
-
-            pages_data.append(page_data)
+                    # the size comes with the record, the file may still be being written
+                    image_sizes[image['file']] = page_record['image_sizes'][image['file']]
+                    new_images.append(image['file'])
+
+            output_record = {
+                'page_number': page_num,
+                'page_data': page_data,
+                'filtered_page_data': None,
+                'excluded_page_data': None,
+                'toc_page_data': None,
+                'images': new_images,
+                'tables': page_record['tables'],
+                'locations': page_record['locations'],
+            }
 
             # ingore data from excluded pages
             if page_num not in exclude_page_numbers and page_num not in toc_page_numbers:
-                filtered_pages_data.append({
+                output_record['filtered_page_data'] = {
                     "page_number": page_num,
-                    "blocks": page_included,
-                    'height': page_info['height'],
-                    'width': page_info['width'],
-                })
-                excluded_pages_data.append({
+                    "blocks": page_record['included'],
+                    'height': page_data['height'],
+                    'width': page_data['width'],
+                }
+                output_record['excluded_page_data'] = {
                     "page_number": page_num,
-                    "blocks": page_excluded,
-                    'height': page_info['height'],
-                    'width': page_info['width'],
-                })
+                    "blocks": page_record['excluded'],
+                    'height': page_data['height'],
+                    'width': page_data['width'],
+                }
 
             if page_num in toc_page_numbers:
-                toc_data.append({
+                output_record['toc_page_data'] = {
                     "page_number": page_num,
-                    "blocks": page_included,
-                    'height': page_info['height'],
-                    'width': page_info['width'],
+                    "blocks": page_record['included'],
+                    'height': page_data['height'],
+                    'width': page_data['width'],
+                }
+
+            if checkpoint is not None:
+                # a page is committed once its files are on disk, so that a resumed run finds them
+                file_writer.wait(page_file_paths(page_record, files['output_dir']))
+                checkpoint.commit({
+                    'record': output_record,
+                    'doc_image_index': doc_image_index,
+                    'doc_table_index': doc_table_index,
+                    'image_occurrences': image_occurrences,
+                    'image_decodes': image_decodes,
+                    'bytes_saved': bytes_saved,
+                    'image_sizes': {image_file: image_sizes[image_file] for image_file in new_images},
+                    'table_timing': page_timing,
                 })
 
+            yield output_record
             pbar.update(1)
 
+    if image_occurrences:
+        print(f"Images: {image_occurrences} on the pages, {len(image_sizes)} unique files written, "
+              f"deduplication saved {image_occurrences - image_decodes} decodes and {bytes_saved} bytes")
+
+    # all the files must be written (and any write error raised) before the document is complete
+    file_writer.close()
+    if checkpoint is not None:
+        checkpoint.close()
+
+    if table_timings:
+        # a toc_only run leaves the timing of the full run in place
+        report_table_timing(table_timings, files['output_dir'],
+                            "toc_table_timing.json" if config.get('toc_only') else "table_timing.json")
+
     if config['outline_blocks'] or config['outline_images'] or config['outline_tables']:
         mu_doc.save(files['output'])
 
-    result = {
-            'pages_data': pages_data, 
-            'filtered_pages_data': filtered_pages_data, 
-            'excluded_pages_data': excluded_pages_data,
-            'toc_data': toc_data, 
-            'images': images, 
-            'tables': tables,
-            'location_info': location_info,
-            # 'new_location': locations,
+
+def new_preprocess_result():
+    return {
+        'pages_data': [],
+        'filtered_pages_data': [],
+        'excluded_pages_data': [],
+        'toc_data': [],
+        'images': [],
+        'tables': [],
+        'location_info': [],
     }
+
+
+def add_page_record(result, page_record, keep_pages=True):
+    """
+    Add a page record of preprocess_pages() to a preprocess_pdf() result, with
+    keep_pages False only the images, tables and TOC pages are kept (for when
+    the page data is streamed to files instead)
+    """
+    result['images'].extend(page_record['images'])
+    result['tables'].extend(page_record['tables'])
+
+    if page_record['toc_page_data'] is not None:
+        result['toc_data'].append(page_record['toc_page_data'])
+
+    if not keep_pages:
+        return
+
+    result['location_info'].append(page_record['locations'])
+    result['pages_data'].append(page_record['page_data'])
+
+    if page_record['filtered_page_data'] is not None:
+        result['filtered_pages_data'].append(page_record['filtered_page_data'])
+        result['excluded_pages_data'].append(page_record['excluded_page_data'])
+
+
+def preprocess_pdf(files, config, page_cache=None):
+    """
+    Process PDF to outline blocks and extract text details
+    """
+    result = new_preprocess_result()
+    for page_record in preprocess_pages(files, config, page_cache):
+        add_page_record(result, page_record)
     return result
 
 
+def stream_filtered_pages(page_records, result, writer=None, keep_pages=True):
+    """
+    Yield the filtered page data of each page as soon as it is produced by
+    preprocess_pages(), so that analyze_pdf() runs while extraction continues
+
+    Each page record is first written by writer (a PageOutputWriter) if given
+    and added to result (see add_page_record()).
+    """
+    for page_record in page_records:
+        if writer is not None:
+            with stage("write_pages", page_record['page_number']):
+                writer.write(page_record)
+        add_page_record(result, page_record, keep_pages)
+
+        if page_record['filtered_page_data'] is not None:
+            yield page_record['filtered_page_data']
+
+
 def increment_numeric(value):
     return str(int(value) + 1)
 
@@ -204,23 +529,28 @@ def is_valid_next_section_number(prev_section, separator, next_section=None, mod
     return False
 
 
-def analyze_pdf(filtered_data, analysis_config, section_text_dir):
+def analyze_pdf(filtered_data, analysis_config, section_text_dir, division_type='default', section_number=None):
 
-    sega = SegmentAnalyzer(analysis_config, section_text_dir)
+    sega = SegmentAnalyzer(analysis_config, section_text_dir, division_type, section_number)
 
-    total_pages = len(filtered_data)
+    # filtered_data may be a lazily read page stream with no known length
+    total_pages = len(filtered_data) if hasattr(filtered_data, '__len__') else None
     with tqdm(total=total_pages, desc="Analyzing Pages", unit="page") as pbar:
         for page_data in filtered_data:
             page_number = page_data["page_number"]
 
-            for block in page_data["blocks"]:
-                block_text = "".join(item["text"] for item in block["text_segments"]).strip()
-                debug = False
-                # debug := (page_number > 80 and page_number < 95):
-                if debug:
-                    print(f"Analyzing {block_text}")
+            with stage("segment_analyzer", page_number):
+                for block in page_data["blocks"]:
+                    block_text = "".join(item["text"] for item in block["text_segments"]).strip()
+                    debug = False
+                    # debug := (page_number > 80 and page_number < 95):
+                    if debug:
+                        print(f"Analyzing {block_text}")
 
-                sega.analyze_segment(block_text, page_number, debug=debug)
+                    sega.analyze_segment(block_text, page_number, debug=debug)
             pbar.update(1)
 
+    with stage("segment_analyzer"):
+        sega.finish()
+
     return sega.get_section_list()
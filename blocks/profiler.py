@@ -0,0 +1,120 @@
+import contextlib
+import json
+import time
+
+# profiler of the process, None while profiling is disabled so that stage()
+# costs a single check
+_profiler = None
+_null_stage = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Wall time, CPU time and call count of each pipeline stage, in total and
+    per page
+
+    Stages timed while a page is extracted (between begin_page() and end_page())
+    are collected for that page only and returned by end_page(), so they can be
+    sent back from a worker process with the page record and added with
+    add_page() in the main process.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.pages = {}
+        self._page = None
+
+    def add(self, name, wall, cpu, page_number=None):
+        if self._page is not None:
+            _add_times(self._page, name, 1, wall, cpu)
+            return
+        _add_times(self.stages, name, 1, wall, cpu)
+        if page_number is not None:
+            _add_times(self.pages.setdefault(page_number, {}), name, 1, wall, cpu)
+
+    def begin_page(self):
+        self._page = {}
+
+    def end_page(self):
+        page, self._page = self._page, None
+        return page
+
+    def add_page(self, page_number, page_stages):
+        page = self.pages.setdefault(page_number, {})
+        for name, times in page_stages.items():
+            _add_times(self.stages, name, times['calls'], times['wall'], times['cpu'])
+            _add_times(page, name, times['calls'], times['wall'], times['cpu'])
+
+    def slowest_pages(self, count=10):
+        page_walls = {page_number: sum(times['wall'] for times in stages.values()) for page_number, stages in self.pages.items()}
+        return sorted(page_walls.items(), key=lambda item: -item[1])[:count]
+
+    def report(self, output_file):
+        """
+        Save the stage and per-page times to output_file and print a summary table
+
+        The times of stages run in worker processes add up over the workers, so
+        with several workers they can add up to more than the total wall time.
+        """
+        total_wall = time.perf_counter() - self.start
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump({'total_wall': total_wall, 'stages': self.stages,
+                       'pages': {str(page_number): stages for page_number, stages in sorted(self.pages.items())}},
+                      f, ensure_ascii=False, indent=4)
+
+        print(f"\nProfile ({total_wall:.2f}s wall), saved to {output_file}")
+        print(f"{'Stage':<22}{'Calls':>10}{'Wall (s)':>12}{'CPU (s)':>12}{'Wall %':>9}")
+        for name, times in sorted(self.stages.items(), key=lambda item: -item[1]['wall']):
+            print(f"{name:<22}{times['calls']:>10}{times['wall']:>12.3f}{times['cpu']:>12.3f}{100 * times['wall'] / total_wall:>9.1f}")
+
+        slowest = self.slowest_pages()
+        if slowest:
+            print("Slowest pages: " + ", ".join(f"{page_number} ({wall:.3f}s)" for page_number, wall in slowest))
+
+
+def _add_times(stages, name, calls, wall, cpu):
+    times = stages.get(name)
+    if times is None:
+        stages[name] = {'calls': calls, 'wall': wall, 'cpu': cpu}
+    else:
+        times['calls'] += calls
+        times['wall'] += wall
+        times['cpu'] += cpu
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'page_number', 'wall', 'cpu')
+
+    def __init__(self, profiler, name, page_number):
+        self.profiler = profiler
+        self.name = name
+        self.page_number = page_number
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu, self.page_number)
+
+
+def enable_profiling():
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def stage(name, page_number=None):
+    """
+    Context manager timing a stage of the pipeline (of page_number if given),
+    a no-op unless profiling is enabled
+    """
+    if _profiler is None:
+        return _null_stage
+    return _Stage(_profiler, name, page_number)
@@ -0,0 +1,135 @@
+class Record:
+    """
+    Base of the __slots__ page data records. A record can also be read and updated
+    like the dict it stands for (block['bbox']['top'], 'exclusion' in block), so
+    the code working on page data loaded from JSON works on records unchanged
+    """
+    __slots__ = ()
+    # fields left out of the dict form while they are None
+    optional = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = frozenset(cls.__slots__)
+
+    def keys(self):
+        return [key for key in self.__slots__ if key not in self.optional or getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            value = getattr(self, key)
+            if value is not None or key not in self.optional:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.fields and (key not in self.optional or getattr(self, key) is not None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {key: _plain(value) for key, value in self.items()}
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == _plain(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def _plain(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def record_to_dict(obj):
+    """
+    json.dump() default for page data holding records
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class BBox(Record):
+    __slots__ = ('x0', 'top', 'x1', 'bottom')
+
+    def __init__(self, x0, top, x1, bottom):
+        self.x0 = x0
+        self.top = top
+        self.x1 = x1
+        self.bottom = bottom
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['x0'], data['top'], data['x1'], data['bottom'])
+
+
+class TextSegment(Record):
+    __slots__ = ('font_size', 'font', 'text')
+
+    def __init__(self, font_size, font, text):
+        self.font_size = font_size
+        self.font = font
+        self.text = text
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['font_size'], data['font'], data['text'])
+
+
+class Block(Record):
+    """
+    Text or image block of a page, exclusion is set (to the reason) for the
+    blocks filtered out as header, footer, image or table content
+    """
+    __slots__ = ('block_number', 'type', 'bbox', 'text_segments', 'exclusion')
+    optional = ('exclusion',)
+
+    def __init__(self, block_number, type, bbox, text_segments=None, exclusion=None):
+        self.block_number = block_number
+        self.type = type
+        self.bbox = bbox
+        self.text_segments = text_segments if text_segments is not None else []
+        self.exclusion = exclusion
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['block_number'], data['type'], BBox.from_dict(data['bbox']),
+                   [TextSegment.from_dict(segment) for segment in data['text_segments']], data.get('exclusion'))
+
+
+class Location(Record):
+    """
+    Location of an image or table on a page, page_index numbers it within the
+    page and doc_index within the document
+    """
+    __slots__ = ('page', 'page_index', 'doc_index', 'bbox', 'file')
+
+    def __init__(self, page, page_index, doc_index, bbox, file):
+        self.page = page
+        self.page_index = page_index
+        self.doc_index = doc_index
+        self.bbox = bbox
+        self.file = file
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['page'], data['page_index'], data['doc_index'], BBox.from_dict(data['bbox']), data['file'])
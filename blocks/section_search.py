@@ -0,0 +1,212 @@
+import glob
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# words, keeping dotted section numbers and names like 8.4.1 or H.264 as one term
+TOKEN_REGEX = re.compile(r"\w+(?:\.\w+)*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    sections_file TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    document INTEGER NOT NULL REFERENCES documents(id),
+    section_id TEXT,
+    number TEXT,
+    title TEXT,
+    start_page INTEGER,
+    textfile TEXT,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_document ON sections(document);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    section INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, section)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_section ON postings(section);
+"""
+
+
+def tokenize(text):
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def file_signature(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def find_sections_file(doc_dir):
+    """
+    Return the <name>_sections.json file written by blk_analysis in doc_dir, or None
+    """
+    sections_files = glob.glob(os.path.join(doc_dir, '*_sections.json'))
+    return sections_files[0] if sections_files else None
+
+
+def section_text(section, doc_dir):
+    """
+    Text of a section record, read from its section_text file if the record doesn't hold it
+    """
+    if 'section_text' in section:
+        return section['section_text']
+
+    text_file = os.path.join(doc_dir, 'section_text', section['textfile'])
+    try:
+        with open(text_file, 'r', encoding='utf-8') as f:
+            return section.get('title', '') + '\n' + f.read()
+    except OSError:
+        return section.get('title', '')
+
+
+class SectionSearchIndex:
+    """
+    BM25 ranked full-text search over the sections of all the documents
+    processed by blk_analysis
+
+    The inverted index (term -> section, term frequency) is kept in an SQLite
+    database along with the section metadata, so that a query only reads the
+    postings of its own terms. Documents are ingested one at a time and
+    re-ingested only when their sections file has changed.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.db = sqlite3.connect(index_file)
+        # each document is ingested in one transaction, WAL avoids a full sync per document
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA cache_size=-65536")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _remove_document(self, document_id):
+        self.db.execute("DELETE FROM postings WHERE section IN (SELECT id FROM sections WHERE document = ?)", (document_id,))
+        self.db.execute("DELETE FROM sections WHERE document = ?", (document_id,))
+        self.db.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def ingest_document(self, doc_dir, name=None):
+        """
+        Add the sections of the document in doc_dir (an output directory of
+        blk_analysis) to the index, replacing any previous version of it
+
+        Returns True if the document was (re)indexed, False if it was already
+        up to date or has no sections file.
+        """
+        name = name or os.path.basename(os.path.normpath(doc_dir))
+        sections_file = find_sections_file(doc_dir)
+        if sections_file is None:
+            return False
+
+        signature = file_signature(sections_file)
+        row = self.db.execute("SELECT id, signature FROM documents WHERE name = ?", (name,)).fetchone()
+        if row is not None and row[1] == signature:
+            return False
+
+        with open(sections_file, 'r', encoding='utf-8') as f:
+            sections = json.load(f)
+
+        with self.db:
+            if row is not None:
+                self._remove_document(row[0])
+
+            document_id = self.db.execute("INSERT INTO documents (name, sections_file, signature) VALUES (?, ?, ?)",
+                                          (name, os.path.abspath(sections_file), signature)).lastrowid
+            postings = []
+            for section in sections:
+                term_counts = Counter(tokenize(section_text(section, doc_dir)))
+                section_rowid = self.db.execute(
+                    "INSERT INTO sections (document, section_id, number, title, start_page, textfile, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (document_id, section.get('section_id'), section.get('number'), section.get('title'),
+                     section.get('start_page'), section.get('textfile'), sum(term_counts.values()))).lastrowid
+                postings.extend((term, section_rowid, tf) for term, tf in term_counts.items())
+
+            # inserting in key order keeps the writes to the postings tree local
+            postings.sort()
+            self.db.executemany("INSERT INTO postings (term, section, tf) VALUES (?, ?, ?)", postings)
+        return True
+
+    def ingest(self, app_dir):
+        """
+        Incrementally index every document directory in app_dir (e.g. pdf_blocks),
+        dropping the documents of app_dir whose sections file no longer exists
+        """
+        stats = {'indexed': 0, 'unchanged': 0, 'removed': 0}
+        for entry in sorted(os.scandir(app_dir), key=lambda entry: entry.name):
+            if not entry.is_dir() or find_sections_file(entry.path) is None:
+                continue
+            if self.ingest_document(entry.path):
+                stats['indexed'] += 1
+            else:
+                stats['unchanged'] += 1
+
+        app_dir = os.path.abspath(app_dir) + os.sep
+        for document_id, sections_file in self.db.execute("SELECT id, sections_file FROM documents").fetchall():
+            if sections_file.startswith(app_dir) and not os.path.exists(sections_file):
+                with self.db:
+                    self._remove_document(document_id)
+                stats['removed'] += 1
+
+        return stats
+
+    def search(self, query, limit=10):
+        """
+        Return the limit best sections for query ranked by BM25, as dicts with
+        the document name, section id, number, title, start page, text file and score
+        """
+        section_count, average_length = self.db.execute("SELECT COUNT(*), AVG(length) FROM sections").fetchone()
+        if not section_count:
+            return []
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            postings = self.db.execute(
+                "SELECT p.section, p.tf, s.length FROM postings p JOIN sections s ON s.id = p.section WHERE p.term = ?",
+                (term,)).fetchall()
+            if not postings:
+                continue
+            idf = math.log(1 + (section_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for section, tf, length in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1))
+                scores[section] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        results = []
+        for section, score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            row = self.db.execute(
+                "SELECT d.name, s.section_id, s.number, s.title, s.start_page, s.textfile "
+                "FROM sections s JOIN documents d ON d.id = s.document WHERE s.id = ?", (section,)).fetchone()
+            results.append({
+                'document': row[0],
+                'section_id': row[1],
+                'number': row[2],
+                'title': row[3],
+                'start_page': row[4],
+                'textfile': row[5],
+                'score': score,
+            })
+        return results
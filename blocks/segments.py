@@ -80,15 +80,113 @@ def build_regex(config_section):
     return toc_pattern
 
 
+# named groups and backreferences, and leading global inline flags of a rule regex
+GROUP_NAME_REGEX = re.compile(r'\(\?P([<=])(\w+)')
+INLINE_FLAGS_REGEX = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+def alternative_regex(name, regex):
+    """
+    Wrap a rule regex as the named alternative of a combined pattern, prefixing
+    its group names with the alternative name so that groups of different
+    rules can't clash, and scoping any leading inline flags to the alternative
+    """
+    regex = GROUP_NAME_REGEX.sub(lambda m: f"(?P{m.group(1)}{name}_{m.group(2)}", regex)
+    flags = INLINE_FLAGS_REGEX.match(regex)
+    if flags:
+        regex = f"(?{flags.group(1)}:{regex[flags.end():]})"
+    return f"(?P<{name}>{regex})"
+
+
+class RuleMatch():
+    """
+    The match of one alternative of a combined pattern, giving access to the
+    groups by the names used in the rule's own regex
+    """
+
+    def __init__(self, match, alternative):
+        self.match = match
+        self.alternative = alternative
+
+    def group(self, name):
+        return self.match.group(f"{self.alternative}_{name}")
+
+
+class DivisionRules():
+    """
+    The rules of a division type, compiled once and reused for every segment:
+    the division search patterns and the section numbering pattern built from
+    the merged common and numbering specific parsing rules, combined into a
+    single alternation so each segment is scanned once
+    """
+
+    def __init__(self, config, division_type):
+        self.division_type = division_type
+        self.division_config = config['division_types'][division_type]
+
+        # alternative name -> (division type, division search config), None for the section numbering rule
+        self.alternatives = {}
+        alternative_regexes = []
+        for index, dtype in enumerate(self.division_config['division_search_rules']):
+            dtype_config = config['division_search_rules'][dtype]
+            name = f"_div{index}"
+            self.alternatives[name] = (dtype, dtype_config)
+            alternative_regexes.append(alternative_regex(name, dtype_config['regex']))
+
+        self.numbering_rule_name = self.division_config['numbering_rules']
+        self.parsing_config = None
+        self.sequence_rules = None
+        if self.numbering_rule_name is not None:
+            numbering = config['numbering_rules'][self.numbering_rule_name]
+            parsing_rule_name = numbering['parsing_rules']
+            self.parsing_config = config['parsing_rules']['common'] | config['parsing_rules'][parsing_rule_name]
+            self.sequence_rules = numbering['sequence_rules']
+            self.alternatives['_number'] = None
+            alternative_regexes.append(alternative_regex('_number', build_regex(self.parsing_config)))
+
+        # alternatives are tried in order at the start of the text, so the first
+        # matching rule wins just as when each rule is matched in turn
+        self.combined_pattern = re.compile('|'.join(alternative_regexes)) if alternative_regexes else None
+
+    def match(self, text):
+        """
+        Match the start of text against all the rules in a single pass
+
+        Returns the (division type, division search config) of the matching division
+        search rule, or None for the section numbering rule, along with the RuleMatch.
+        Returns (None, None) if no rule matches.
+        """
+        if self.combined_pattern is None:
+            return None, None
+
+        match = self.combined_pattern.match(text)
+        if match is None:
+            return None, None
+
+        return self.alternatives[match.lastgroup], RuleMatch(match, match.lastgroup)
+
+
 class SegmentAnalyzer():
 
-    def __init__(self, config, text_dir, division_type='default'):
+    def __init__(self, config, text_dir, division_type='default', section_number=None):
+        """
+        The analysis starts in division_type, after section section_number when
+        it's given (e.g. to analyze pages from the middle of a document)
+        """
         self.section_id = 0
         self.text_dir = text_dir
         self.config = config
-        self.section_number = None
+        self.division_rules_cache = {}
+        self.section_number = section_number
         self.section_prefix = None
-        self.section_text = ""
+        # a division entered by a search rule with a prefix (e.g. Annex A) numbers
+        # its sections from the prefix, which is the first part of the section number
+        if section_number and config.get('division_search_rules', {}).get(division_type, {}).get('prefix_match'):
+            self.section_prefix = section_number.split(".")[0]
+        # the text of the current section is kept as a list of parts, joined once
+        # the section is closed, and is streamed to the section's text file as it is added
+        self.section_text_parts = []
+        self.section_file = None
         self.set_division(division_type)
         self.last_div_search_config = None
         self.section_record = None
@@ -101,11 +199,40 @@ class SegmentAnalyzer():
             print(f"Division type {division_type} is not defined in the configuration file")
             return
 
-        self.division_config = dtypes[division_type]
+        if division_type not in self.division_rules_cache:
+            self.division_rules_cache[division_type] = DivisionRules(self.config, division_type)
+
+        self.division_rules = self.division_rules_cache[division_type]
+        self.division_config = self.division_rules.division_config
 
     def get_section_list(self):
         return self.section_list
 
+    @property
+    def section_text(self):
+        return "".join(self.section_text_parts)
+
+    def add_section_text(self, text):
+        self.section_text_parts.append(text)
+        if self.section_file:
+            self.section_file.write(text)
+
+    def reset_section_text(self):
+        self.section_text_parts = []
+        if self.section_file:
+            self.section_file.seek(0)
+            self.section_file.truncate()
+
+    def finish(self):
+        """
+        Finish the analysis: the last section is not terminated by a following
+        section and isn't part of the section list, so its partial text file is removed
+        """
+        if self.section_file:
+            self.section_file.close()
+            os.remove(self.section_file.name)
+            self.section_file = None
+
     def is_valid_next_section_number(self, separator, next_section=None):
 
         # TODO -- don't add separator if ""
@@ -120,8 +247,7 @@ class SegmentAnalyzer():
             else:
                 return self.section_prefix
 
-        numbering_model_name = self.division_config['numbering_rules']
-        numbering_model = self.config['numbering_rules'][numbering_model_name]['sequence_rules']
+        numbering_model = self.division_rules.sequence_rules
 #        print("Numbering Model:")
 #        pprint(numbering_model)
 
@@ -183,49 +309,37 @@ class SegmentAnalyzer():
         return False
 
     def analyze_segment(self, text, page_number, debug=False):
-        # check for start of new divisions
-        for dtype in self.division_config['division_search_rules']:
-            dtype_config = self.config['division_search_rules'][dtype]
-            div_search_config = dtype_config['regex']
-            # if self.last_div_search_config != div_search_config:
-            #     print(f"New search config {div_search_config}")
-            self.last_div_search_config = div_search_config
-            div_regex = re.compile(div_search_config)
-            div_match = div_regex.match(text)
-            if debug:
-                print(f"ANALYZE SEG: Checking {text} with rule {div_search_config}")
-
-            if div_match:
-                print("Div Text: ", text)
-                self.set_division(dtype)
-                number_field = dtype_config.get('number_match', None)
-                prefix_field = dtype_config.get('prefix_match', None)
-                if number_field is not None:
-                    self.section_number = div_match.group(number_field)
-                    # print(f"New Div: Setting number to  {self.section_number}")
-                else:
-                    self.section_number = None
-
-                if prefix_field is not None:
-                    self.section_prefix = div_match.group(prefix_field)
-                    # print(f"New Div: Setting prefix to  {self.section_prefix}")
-                else:
-                    self.section_prefix = None
-
-                print(f"Segment Analyzer:  Found div type {dtype} number: {self.section_number or 'NA'} pref: {self.section_prefix or 'NA'} (text: {text}")
-                # TODO -- close previous section
-                self.section_text = ""
-                return
-
-        numb_rule_name = self.division_config['numbering_rules']
-        if numb_rule_name is not None:
-            numbering = self.config['numbering_rules'][numb_rule_name]
-            parsing_config = self.config['parsing_rules']['common']
-            parsing_rule_name = numbering['parsing_rules']
-            parsing_config = parsing_config | self.config['parsing_rules'][parsing_rule_name]
-            numbering_regex_string = build_regex(parsing_config)
-            numbering_regex_pattern = re.compile(numbering_regex_string)
-            numbering_match = numbering_regex_pattern.match(text)
+        # check for start of new divisions and for a new section with a single scan
+        division_rule, rule_match = self.division_rules.match(text)
+        if debug:
+            print(f"ANALYZE SEG: Checking {text} with rule {self.division_rules.combined_pattern.pattern if self.division_rules.combined_pattern else None}")
+
+        if division_rule is not None:
+            dtype, dtype_config = division_rule
+            print("Div Text: ", text)
+            self.set_division(dtype)
+            number_field = dtype_config.get('number_match', None)
+            prefix_field = dtype_config.get('prefix_match', None)
+            if number_field is not None:
+                self.section_number = rule_match.group(number_field)
+                # print(f"New Div: Setting number to  {self.section_number}")
+            else:
+                self.section_number = None
+
+            if prefix_field is not None:
+                self.section_prefix = rule_match.group(prefix_field)
+                # print(f"New Div: Setting prefix to  {self.section_prefix}")
+            else:
+                self.section_prefix = None
+
+            print(f"Segment Analyzer:  Found div type {dtype} number: {self.section_number or 'NA'} pref: {self.section_prefix or 'NA'} (text: {text}")
+            # TODO -- close previous section
+            self.reset_section_text()
+            return
+
+        if self.division_rules.numbering_rule_name is not None:
+            parsing_config = self.division_rules.parsing_config
+            numbering_match = rule_match
             if numbering_match:
                 next_section_number = numbering_match.group('number')
                 separator = "."  # TODO configure this
@@ -234,9 +348,9 @@ class SegmentAnalyzer():
                     # TODO -- close previous section
                     # print(f"SA - Valid New Section {next_section_number}")
                     if self.section_record:
-                        section_text_file = os.path.join(self.text_dir, self.section_record['textfile'])
-                        with open(section_text_file, "w") as output:
-                            output.write(self.section_text)
+                        # the section text has already been written to its file as it was added
+                        self.section_file.close()
+                        self.section_file = None
 
                         self.section_record['section_text'] = self.section_record['title'] + '\n' + self.section_text
                         self.section_record['section_id'] = self.section_record['number']
@@ -246,14 +360,15 @@ class SegmentAnalyzer():
                         # pprint(self.section_record)
 
                     self.section_number = next_section_number
-                    self.section_text = ""
                     # since we found the line that has the title, there will not be text yet
                     # so start the section with empty text
+                    self.reset_section_text()
                     self.section_record = {
                         "id":  self.section_id,
                         "start_page": page_number,
                         "textfile":  f"section_{self.section_id}.txt"
                     }
+                    self.section_file = open(os.path.join(self.text_dir, self.section_record['textfile']), "w")
                     self.section_id += 1
 
                     # add in all the sections from the regex groups matches
@@ -264,4 +379,4 @@ class SegmentAnalyzer():
                             self.section_record[group] = numbering_match.group(group)
                     return
 
-            self.section_text += text + "\n"
+            self.add_section_text(text + "\n")
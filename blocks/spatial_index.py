@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+from operator import itemgetter
+
+# below this many items a linear scan is cheaper than maintaining the grid
+LINEAR_SCAN_LIMIT = 8
+
+
+def overlaps(bbox1, bbox2):
+    return bbox1['x0'] < bbox2['x1'] and bbox1['x1'] > bbox2['x0'] and bbox1['top'] < bbox2['bottom'] and bbox1['bottom'] > bbox2['top']
+
+
+class BBoxIndex:
+    """
+    Grid bucket index over items with bbox dicts ({'x0', 'top', 'x1', 'bottom'}
+    as produced by normalize_bbox/rect_to_dict), with bbox_key=None the items
+    are the bbox dicts themselves
+
+    The grid over the page is split into grid_size x grid_size cells, each
+    item is added to the cells its bbox covers, and a query only tests the
+    items of the cells the query bbox covers. Queries return items in the
+    order they were added, so the first overlap is the same item a linear
+    scan of the list would find.
+
+    bounds (a bbox dict) defaults to the extent of the initial items and must
+    be given when items are added later; bboxes outside of the bounds are
+    clamped to the border cells.
+    """
+
+    def __init__(self, items=(), bbox_key='bbox', bounds=None, grid_size=16):
+        self.bbox = itemgetter(bbox_key) if bbox_key is not None else (lambda item: item)
+        self.grid_size = grid_size
+        self.items = []
+        self.cells = defaultdict(list)
+        self.grid = False
+
+        items = list(items)
+        if bounds is None and items:
+            bboxes = [self.bbox(item) for item in items]
+            bounds = {
+                'x0': min(min(bbox['x0'], bbox['x1']) for bbox in bboxes),
+                'top': min(min(bbox['top'], bbox['bottom']) for bbox in bboxes),
+                'x1': max(max(bbox['x0'], bbox['x1']) for bbox in bboxes),
+                'bottom': max(max(bbox['top'], bbox['bottom']) for bbox in bboxes),
+            }
+        self.bounds = bounds or {'x0': 0, 'top': 0, 'x1': 1, 'bottom': 1}
+        self.cell_width = max(self.bounds['x1'] - self.bounds['x0'], 1) / grid_size
+        self.cell_height = max(self.bounds['bottom'] - self.bounds['top'], 1) / grid_size
+
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell_range(self, low, high, origin, cell_size):
+        # bboxes may be inverted (e.g. the empty rect of an image that isn't shown),
+        # so cover the cells between the smaller and the larger coordinate
+        low, high = min(low, high), max(low, high)
+        if not (math.isfinite(low) and math.isfinite(high)):
+            return range(0, self.grid_size)
+        start = min(max(int((low - origin) // cell_size), 0), self.grid_size - 1)
+        end = min(max(int((high - origin) // cell_size), 0), self.grid_size - 1)
+        return range(start, end + 1)
+
+    def _cells(self, bbox, margin=0):
+        columns = self._cell_range(bbox['x0'] - margin, bbox['x1'] + margin, self.bounds['x0'], self.cell_width)
+        rows = self._cell_range(bbox['top'] - margin, bbox['bottom'] + margin, self.bounds['top'], self.cell_height)
+        return [(column, row) for column in columns for row in rows]
+
+    def _grid_add(self, index, item):
+        for cell in self._cells(self.bbox(item)):
+            self.cells[cell].append(index)
+
+    def add(self, item):
+        index = len(self.items)
+        self.items.append(item)
+
+        if self.grid:
+            self._grid_add(index, item)
+        elif len(self.items) > LINEAR_SCAN_LIMIT:
+            self.grid = True
+            for added_index, added_item in enumerate(self.items):
+                self._grid_add(added_index, added_item)
+
+        return index
+
+    def candidates(self, bbox, margin=0):
+        """
+        Indexes (in insertion order) of the items that may overlap bbox expanded by margin
+        """
+        if not self.grid:
+            return range(len(self.items))
+
+        indexes = set()
+        for cell in self._cells(bbox, margin):
+            indexes.update(self.cells.get(cell, ()))
+        return sorted(indexes)
+
+    def first_overlap(self, bbox, overlap=overlaps, margin=0):
+        """
+        Return (index, item) of the first added item for which overlap(bbox, item bbox)
+        is true, or (None, None). margin must cover any tolerance the overlap test allows.
+        """
+        for index in self.candidates(bbox, margin):
+            item = self.items[index]
+            if overlap(bbox, self.bbox(item)):
+                return index, item
+        return None, None
+
+    def overlapping(self, bbox, overlap=overlaps, margin=0):
+        """
+        Return the (index, item) of all the items for which overlap(bbox, item bbox) is true
+        """
+        return [(index, self.items[index]) for index in self.candidates(bbox, margin)
+                if overlap(bbox, self.bbox(self.items[index]))]
+
+    def first_overlaps(self, bboxes, overlap=overlaps, margin=0):
+        """
+        Batched first_overlap() for all the bboxes (e.g. all the blocks of a page)
+        """
+        return [self.first_overlap(bbox, overlap, margin) for bbox in bboxes]
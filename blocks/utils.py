@@ -1,3 +1,4 @@
+import bisect
 import pymupdf
 
 
@@ -29,17 +30,84 @@ def dict_to_rect(bbox):
     return pymupdf.Rect(bbox['x0'], bbox['top'], bbox['x1'], bbox['bottom'])
 
 
-def parse_page_ranges(page_ranges, total_pages, default_range=None):
-    if not page_ranges:
-        return default_range if default_range is not None else list(range(1, total_pages + 1))
+class PageSet:
+    """
+    Set of page numbers kept as sorted, non overlapping (start, end) intervals
+    (inclusive), so large ranges are never expanded into lists of pages
+    """
 
-    pages = []
-    for page_range in page_ranges.split(","):
-        if "-" in page_range:
-            start, end = page_range.split("-")
-            start = int(start) if start else 1
-            end = int(end) if end else total_pages
-            pages.extend(range(start, end + 1))
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if start > end:
+                continue
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.intervals = [tuple(interval) for interval in merged]
+        self._starts = [start for start, end in self.intervals]
+
+    @classmethod
+    def parse(cls, page_ranges, total_pages, default_all=True):
+        """
+        Parse page ranges (e.g. "1-3,5,7-") clamped to the pages of the document,
+        no ranges selects all the pages when default_all is set, otherwise none
+        """
+        if not page_ranges:
+            return cls([(1, total_pages)] if default_all else [])
+
+        intervals = []
+        for page_range in page_ranges.split(","):
+            if "-" in page_range:
+                start, end = page_range.split("-")
+                start = int(start) if start else 1
+                end = int(end) if end else total_pages
+            else:
+                start = end = int(page_range)
+            intervals.append((max(start, 1), min(end, total_pages)))
+        return cls(intervals)
+
+    def __contains__(self, page_num):
+        index = bisect.bisect_right(self._starts, page_num) - 1
+        return index >= 0 and page_num <= self.intervals[index][1]
+
+    def __iter__(self):
+        for start, end in self.intervals:
+            yield from range(start, end + 1)
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in self.intervals)
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __or__(self, other):
+        return PageSet(self.intervals + other.intervals)
+
+    def __repr__(self):
+        return "PageSet(" + ",".join(f"{start}-{end}" if start != end else f"{start}" for start, end in self.intervals) + ")"
+
+
+def page_shards(page_numbers, workers):
+    """
+    Split the pages into contiguous shards, several per worker so that
+    workers finishing early can pick up the remaining shards
+    """
+    shard_size = max(1, -(-len(page_numbers) // (workers * 4)))
+    return [page_numbers[i:i + shard_size] for i in range(0, len(page_numbers), shard_size)]
+
+
+def text_map_lines(page):
+    """
+    Split the text map of a pdfplumber page (the one extract_text() is built
+    from) into its lines, each a list of (text, char) pairs where char is None
+    for the spaces inserted between words
+    """
+    lines = [[]]
+    for text, char in page.get_textmap().tuples:
+        if text == "\n" and char is None:
+            lines.append([])
         else:
-            pages.append(int(page_range))
-    return pages
+            lines[-1].append((text, char))
+    return lines
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import time
+from blocks.page_output import load_pages, page_writer, write_json_pages
+
+
+def parse_arguments():
+    """
+    Parse command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Convert page block data (blocks, filtered, excluded or toc output) between JSON, JSON Lines and binary block files')
+    parser.add_argument('input_file', help='Input .json, .jsonl or .pblk file')
+    parser.add_argument('output_file', help='Output file, the format is taken from the extension (.json, .jsonl or .pblk)')
+    parser.add_argument('-z', '--compress', action='store_true', help='zstd compress the pages of a .pblk output (needs the zstandard package)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    start = time.perf_counter()
+    pages = load_pages(args.input_file)
+
+    if args.output_file.endswith(('.pblk', '.jsonl')):
+        writer = page_writer(args.output_file, args.compress)
+        for page in pages:
+            writer.write_page(page)
+        writer.close()
+    else:
+        write_json_pages(args.output_file, pages)
+
+    print(f"Converted {args.input_file} ({os.path.getsize(args.input_file)} bytes) to {args.output_file} "
+          f"({os.path.getsize(args.output_file)} bytes) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
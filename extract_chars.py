@@ -174,12 +174,13 @@ class Line:
         return self._x1
 
 
-def find_lines(chars):
-
-    pages = []
+def iter_pages(chars):
+    """
+    Lazily find the lines of each page, yielding the Page once its lines are
+    found. chars is an iterable of the (sorted) char records of each page.
+    """
     for pg_num, pg_chars in enumerate(chars, 1):
         page = Page(pg_num)
-        pages.append(page)
         cur_line = None
         for index, c in enumerate(pg_chars):
             # check some items
@@ -203,7 +204,26 @@ def find_lines(chars):
         if cur_line:
             page.add_line(cur_line)
 
-    return pages
+        yield page
+
+
+def find_lines(chars):
+    return list(iter_pages(chars))
+
+
+def iter_spacing(pages):
+    """
+    Lazily yield the h_space and v_space records of the pages in line order,
+    finding the lines of a page only when its records are asked for
+    """
+    for page in pages:
+        for info in page.lines_info:
+            if info['type'] == 'v_space':
+                yield info
+            else:
+                for lc in info['line_chars']:
+                    if lc.get('type') == 'h_space':
+                        yield lc
 
 
 def extract_chars_from_pdf(file_path, output_directory, top, bottom, x0, x1, store_detail=False):
@@ -233,20 +253,15 @@ def extract_chars_from_pdf(file_path, output_directory, top, bottom, x0, x1, sto
             print(f"Cropped page height {cropped_page.height} vs page {cropped_page.width}")
 
 
-            fields_to_keep = ['y0', 'x0', 'y1', 'x1', 'text', 'size', 'height', 'fontname', 'width']
-            # fields to rename and adjust to have origin at uppper left instead of bottom left
-            fields_to_convert = {'y0': 'bottom', 'y1': 'top'}
-            fields_to_copy = [field for field in fields_to_keep if field not in fields_to_convert]
-
-            def convert_origin(height):
-                return page_height - height
-
-            # Create a new list with remapped and retained fields
-            page_chars = [{**{new_key: convert_origin(d[old_key]) for old_key, new_key in fields_to_convert.items() if old_key in d},
-                          **{key: d[key] for key in fields_to_copy if key in d}} for d in cropped_page.chars]
+            # keep the fields of each char, with y0/y1 converted to bottom/top so the
+            # origin is at upper left instead of bottom left
+            page_chars = [{'bottom': page_height - d['y0'], 'top': page_height - d['y1'], 'x0': d['x0'], 'x1': d['x1'],
+                           'text': d['text'], 'size': d['size'], 'height': d['height'], 'fontname': d['fontname'],
+                           'width': d['width']} for d in cropped_page.chars]
 
             char_data.append(sorted(page_chars, key=itemgetter('top', 'x0', 'bottom', 'x1')))
-            full_char_data.append(sorted(cropped_page.chars, key=itemgetter('top', 'x0', 'bottom', 'x1')))
+            if store_detail:
+                full_char_data.append(sorted(cropped_page.chars, key=itemgetter('top', 'x0', 'bottom', 'x1')))
 
         base_name = os.path.splitext(os.path.basename(file_path))[0]
         output_file = os.path.join(output_directory, f"{base_name}_chars.json")
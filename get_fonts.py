@@ -1,96 +1,68 @@
-import pdfplumber
 import argparse
-from collections import defaultdict
+import json
+from blocks.font_stats import iter_page_font_stats, merge_histograms, body_font, heading_fonts
 
 # Function to set up argument parser
 def setup_argparse():
     parser = argparse.ArgumentParser(description='Process a PDF file to extract font sizes and text.')
     parser.add_argument('filename', type=str, help='the filename of the PDF document')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes used to scan pages in parallel')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the summary table, not the fonts of every line')
+    parser.add_argument('-o', '--output', help='Save the font histogram and the detected body and heading fonts to this JSON file')
     return parser
 
-# Set up argument parser
-parser = setup_argparse()
-args = parser.parse_args()
 
-# Dictionary to store line and partial line counts for each font-size combination
-font_size_counts = defaultdict(lambda: {'lines': 0, 'partial_lines': 0})
+def print_page_lines(page_stats):
+    # Print page divider
+    print(f"------------- Page {page_stats['page_number']} -----------------")
 
-# Open the PDF document
-with pdfplumber.open(args.filename) as pdf:
-    # Iterate through each page
-    for page_number, page in enumerate(pdf.pages, start=1):
-        # Print page divider
-        print(f"------------- Page {page_number} -----------------")
-        
-        # Extract text lines
-        lines = page.extract_text().split('\n')
-        
-        # Iterate through each line
-        for line_number, line in enumerate(lines, start=1):
-            # Extract characters for the line
-            chars = page.chars
-            
-            # Filter characters that belong to the current line
-            line_chars = [char for char in chars if char['top'] >= line_number * 10 and char['top'] < (line_number + 1) * 10]
-            
-            # Initialize current font-size and text
-            current_font_size = None
-            current_text = ""
-            line_font_sizes = set()
+    for line_number, line in enumerate(page_stats['lines'], start=1):
+        print(f"Line {line_number}:")
+        runs = line['runs']
+        for run_index, (font_size_key, text) in enumerate(runs):
+            display_text = text.strip() if text.strip() else "<<blank>>"
+            # the last run of the line shows whether the whole line is in a single font-size
+            if run_index == len(runs) - 1:
+                font_indicator = "FL" if len(line['fonts']) <= 1 else "  "
+                print(f"    Font {font_size_key[0]}, Size {font_size_key[1]} {font_indicator} (len {len(text)}): {display_text}")
+            else:
+                print(f"    Font {font_size_key[0]}, Size {font_size_key[1]} (len {len(text)}): {display_text}")
+        print()  # Empty line for better readability
 
-            # Print line number
-            print(f"Line {line_number}:")
-            
-            # Iterate through characters in the line
-            for char in line_chars:
-                font_size = round(char['size'], 1)
-                font_name = char.get('fontname', 'Unknown')
-                font_size_key = (font_name, font_size)
-                text = char['text']
-                
-                # Determine if the text is whitespace
-                is_whitespace = text.isspace()
-                
-                # Check if the font-size has changed, ignoring whitespace
-                if font_size_key != current_font_size and not is_whitespace:
-                    # Print the current text if it's not empty and current_font_size is not None
-                    if current_text and current_font_size is not None:
-                        display_text = current_text.strip() if current_text.strip() else "<<blank>>"
-                        print(f"    Font {current_font_size[0]}, Size {current_font_size[1]} (len {len(current_text)}): {display_text}")
-                        
-                        # Update line font-sizes if the text is not blank
-                        if display_text != "<<blank>>":
-                            line_font_sizes.add(current_font_size)
-                    
-                    # Update the current font-size and text
-                    current_font_size = font_size_key
-                    current_text = text
-                else:
-                    # Add the text to the current text
-                    current_text += text
-            
-            # Print the last text block in the line if current_font_size is not None
-            if current_text and current_font_size is not None:
-                display_text = current_text.strip() if current_text.strip() else "<<blank>>"
-                # Determine if the line is a single font-size line
-                font_indicator = "FL" if len(line_font_sizes) == 0 or (len(line_font_sizes) == 1 and not is_whitespace) else "  "
-                print(f"    Font {current_font_size[0]}, Size {current_font_size[1]} {font_indicator} (len {len(current_text)}): {display_text}")
-                
-                # Update line font-sizes if the text is not blank
-                if display_text != "<<blank>>":
-                    line_font_sizes.add(current_font_size)
-            
-            # Update font-size counts
-            for font_size_key in line_font_sizes:
-                font_size_counts[font_size_key]['lines'] += 1
-            if len(line_font_sizes) > 1:
-                for font_size_key in line_font_sizes:
-                    font_size_counts[font_size_key]['partial_lines'] += 1
-            
-            print()  # Empty line for better readability
 
-# Print summary table
-print("Summary Table:")
-print(f"{'Font':<30}{'Size':<10}{'Lines':<10}{'Partial Lines':<15}")
-for (font, size), counts in sorted(font_size_counts.items()):
-    print(f"{font:<30}{size:<10}{counts['lines']:<10}{counts['partial_lines']:<15}")
+def main():
+    args = setup_argparse().parse_args()
+
+    # font-size histogram of every page, merged into the document's line and partial line counts
+    page_histograms = []
+    for page_stats in iter_page_font_stats(args.filename, workers=args.workers):
+        if not args.quiet:
+            print_page_lines(page_stats)
+        page_histograms.append(page_stats['histogram'])
+    font_size_counts = merge_histograms(page_histograms)
+
+    # Print summary table
+    print("Summary Table:")
+    print(f"{'Font':<30}{'Size':<10}{'Lines':<10}{'Partial Lines':<15}")
+    for (font, size), counts in sorted(font_size_counts.items()):
+        print(f"{font:<30}{size:<10}{counts['lines']:<10}{counts['partial_lines']:<15}")
+
+    body = body_font(font_size_counts)
+    headings = heading_fonts(font_size_counts)
+    if body:
+        print(f"\nBody font: {body[0]} {body[1]}")
+        print("Heading fonts: " + ", ".join(f"{font} {size}" for font, size in headings))
+
+    if args.output:
+        output = {
+            'fonts': [{'fontname': font, 'size': size, **counts} for (font, size), counts in sorted(font_size_counts.items())],
+            'body_font': {'fontname': body[0], 'size': body[1]} if body else None,
+            'heading_fonts': [{'fontname': font, 'size': size} for font, size in headings],
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=4)
+        print(f"Font statistics saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
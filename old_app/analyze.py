@@ -1,10 +1,15 @@
 import fitz  # PyMuPDF
 import pdfplumber
+from pdfplumber.utils import objects_to_bbox
 import json
 import argparse
 import os
 import sys
 from reportlab.pdfgen import canvas
+# run as a module from the top of the repository (python -m old_app.analyze) so that
+# the blocks package is importable
+from blocks.spatial_index import BBoxIndex
+from blocks.utils import text_map_lines
 
 count = 0
 
@@ -91,6 +96,39 @@ def extract_images_and_tables(pdf_path, output_dir):
     return images, tables, location_info
 
 
+def locate_lines(page):
+    """
+    Split the text of a page into lines along with the bbox of the chars of each line
+
+    The page's text map (the one extract_text() is built from) pairs every
+    character of the text with the char it came from, so a single pass over it
+    gives each line's chars directly, without searching the page for the line's
+    text. Each char belongs to exactly one line, so repeated lines can't be
+    matched to the same place. Returns a list of (line text, bbox details) in
+    the order of extract_text(), bbox details are in the format of page.search()
+    results and None for a line with no chars.
+    """
+    located_lines = []
+    for line_tuples in text_map_lines(page):
+        line = "".join(text for text, _ in line_tuples)
+        line_chars = [char for _, char in line_tuples if char is not None]
+        bbox_details = None
+        if line_chars:
+            x0, top, x1, bottom = objects_to_bbox(line_chars)
+            bbox_details = {
+                "text": line,
+                "x0": x0,
+                "top": top,
+                "x1": x1,
+                "bottom": bottom,
+                "groups": (),
+                "chars": line_chars,
+            }
+        located_lines.append((line, bbox_details))
+
+    return located_lines
+
+
 def analyze_pdf(pdf_path, header_size, footer_size, debug_match=False):
     with pdfplumber.open(pdf_path) as pdf:
         pages_output = []
@@ -115,58 +153,24 @@ def analyze_pdf(pdf_path, header_size, footer_size, debug_match=False):
                 'bottom': page_height
             }
 
-            # Extract lines
+            # Extract lines, locating each line through the chars it was built from
             lines = []
-            matched_areas = []
-            extracted_text = page.extract_text()
-            # split the text into lines
-            line_texts = extracted_text.split('\n') if extracted_text else []
+            located_lines = locate_lines(page)
 
-            for line_num, line in enumerate(line_texts):
+            for line_num, (line, bbox_details) in enumerate(located_lines):
                 if line.strip():
                     if debug_match:
                         print(f"Line {line_num} -  {line}")
-                    search_results = page.search(line, regex=False, y_tolerance=4)
-                    bbox_details = None
-                    for result in search_results:
-                        # Check if the result overlaps with any previously matched areas
-                        overlap = False
-                        for index, area in enumerate(matched_areas):
-                            if (result['x0'] < area['x1'] and result['x1'] > area['x0'] and
-                                    result['top'] < area['bottom'] and result['bottom'] > area['top']):
-                                overlap = True
-                                if debug_match:
-                                    print(f"    Overlaps with area {index}:")
-                                    print(f"    Area  : {format_bbox(area)}!")
-                                    print(f"    Result: {format_bbox(result)}!")
-                                break
-                        if not overlap:
-                            bbox_details = result
-                            matched_areas.append(bbox_details)
-                            if debug_match:
-                                print(f"    Added bbox to matched areas: x0: {format_bbox(result)} -- {len(matched_areas)-1}")
-                            break
 
                     if not bbox_details:
                         if debug_match:
                             print(f"Line not found on page {page_number + 1}: '{line}'")
 
                         # Attempt to use the bottom of the previous line and the top of the next line
-                        if line_num == 0:
-                            prev_bottom = 0
-                        else:
-                            prev_bottom = lines[line_num - 1]['bbox_details']['bottom']
-
-                        if line_num + 1 < len(line_texts) and line_texts[line_num + 1].strip():
-                            next_search_results = page.search(line_texts[line_num + 1], regex=False)
-                            if next_search_results:
-                                next_top = next_search_results[0]['top']
-                            else:
-                                print(f"ERROR: Search Match not found for line on page {page_number + 1}: '{line}'", file=sys.stderr)
-                                print("Skipping")
-                                continue
-                        else:
-                            print(f"ERROR: Search Match not found for line on page {page_number + 1} line {line_num}: '{line}'", file=sys.stderr)
+                        prev_bottom = lines[-1]['bbox_details']['bottom'] if lines else 0
+                        next_details = located_lines[line_num + 1][1] if line_num + 1 < len(located_lines) else None
+                        if not next_details:
+                            print(f"ERROR: Match not found for line on page {page_number + 1} line {line_num}: '{line}'", file=sys.stderr)
                             print("Skipping")
                             continue
 
@@ -174,16 +178,16 @@ def analyze_pdf(pdf_path, header_size, footer_size, debug_match=False):
                             'x0': 0,
                             'top': prev_bottom,
                             'x1': page_width,
-                            'bottom': next_top
+                            'bottom': next_details['top']
                         }
-                    
+
                     bbox = {
                         'x0': bbox_details['x0'],
                         'top': bbox_details['top'],
                         'x1': bbox_details['x1'],
                         'bottom': bbox_details['bottom']
                     }
-                    
+
                     lines.append({
                         'id': f'line_{line_num}',
                         'text': line,
@@ -286,7 +290,6 @@ def filter_text(pages_output, location_info):
         page_number = page_data['page_number']
         print(f"Filtering ouput ... Page {page_number}", end="\r")
         filtered_lines = []
-        used_references = set()
         locations = location_info['locations_by_page'][page_number-1]
         removed_lines = []
         removed_lines_by_page.append(removed_lines)
@@ -299,69 +302,76 @@ def filter_text(pages_output, location_info):
         # considered within the boundry
         tolerance = 2
 
+        # spatial indexes of the images and tables on the page, the overlap test
+        # allows for the tolerance on both bboxes so candidates need a margin of twice that
+        overlap_margin = 2 * tolerance
+        image_index = BBoxIndex(image for image in locations['images'] if image['page'] == page_number - 1)
+        table_index = BBoxIndex(table for table in locations['tables'] if table['page'] == page_number - 1)
+
+        def line_overlaps(line_bbox, ref_bbox):
+            return bboxes_overlap(line_bbox, ref_bbox, tolerance)
+
+        # images and tables whose reference hasn't been inserted yet
+        pending_images = list(locations['images'])
+        pending_tables = list(locations['tables'])
+
         for line_num, line in enumerate(page_data['lines']['lines']):
             # Check if the line overlaps with any image or table
             removed_line = False
 
             # print(f"{' '*5}Line {line_num} {line['bbox']}")
-            for idx, image in enumerate(locations['images']):
-                # print(f"{' '*10}Checking image {idx} {image['bbox']}")
-                reference = f"[Image {image['doc_index']}: {image['file']}]"
-                if not removed_line and image['page'] == page_number - 1 and bboxes_overlap(line['bbox'], image['bbox'], tolerance):
-                    # print(f"{' '*15}Found location for Image {reference}")
-                    # print(f"{' '*15}Text: {line['text']}")
-                    removed_line = {
-                        'line_number': line_num,
-                        'ref_type': 'image',
-                        'reference': reference,
-                        'ref_bbox': image['bbox']
-                    }
-                    removed_lines.append(removed_line)
-                    removed_line = True
+            _, image = image_index.first_overlap(line['bbox'], line_overlaps, overlap_margin)
+            if image is not None:
+                # print(f"{' '*15}Text: {line['text']}")
+                removed_lines.append({
+                    'line_number': line_num,
+                    'ref_type': 'image',
+                    'reference': f"[Image {image['doc_index']}: {image['file']}]",
+                    'ref_bbox': image['bbox']
+                })
+                removed_line = True
 
-                # if the top of current line is below the bottom of image
-                # we've found next line after the table, and need to insert the reference 
-                # before it.
-                if reference not in used_references and line_is_below_image(image, line, tolerance):
-                    # print(f"Found location for Image {reference}")
-                    used_references.add(reference)
-                    # Insert reference
-                    reference_rec = {
-                        'type': 'image',
-                        'text': reference,
-                        'bbox': image['bbox'],
-                    }
-                    filtered_lines.append(reference_rec)
-                    # print(f"Added Reference {reference_rec}")
-
-            for idx, table in enumerate(locations['tables']):
-                # print(f"{' '*10}Checking table {idx} {table['bbox']}")
-                reference = f"[Table {table['doc_index']}: {table['file']}]"
-                if not removed_line and table['page'] == page_number - 1 and bboxes_overlap(line['bbox'], table['bbox'], tolerance):
-                    # print(f"{' '*10}Found overlap with for table {reference}")
+            if not removed_line:
+                _, table = table_index.first_overlap(line['bbox'], line_overlaps, overlap_margin)
+                if table is not None:
                     # print(f"{' '*15}Text: {line['text']}")
-                    removed_line = {
+                    removed_lines.append({
                         'line_number': line_num,
                         'ref_type': 'table',
-                        'reference': reference,
+                        'reference': f"[Table {table['doc_index']}: {table['file']}]",
                         'ref_bbox': table['bbox']
-                    }
-                    removed_lines.append(removed_line)
+                    })
                     removed_line = True
 
-                # if the top of current line is below the bottom of table
-                # we've found next line after the table, and need to insert the reference 
-                # before it.
-                if reference not in used_references and line_is_below_table(table, line, tolerance):
-                    used_references.add(reference)
-                    # Insert reference 
-                    reference_rec = {
+            # if the top of current line is below the bottom of image
+            # we've found next line after the image, and need to insert the reference
+            # before it.
+            still_pending = []
+            for image in pending_images:
+                if line_is_below_image(image, line, tolerance):
+                    # Insert reference
+                    filtered_lines.append({
+                        'type': 'image',
+                        'text': f"[Image {image['doc_index']}: {image['file']}]",
+                        'bbox': image['bbox'],
+                    })
+                else:
+                    still_pending.append(image)
+            pending_images = still_pending
+
+            # same for the tables
+            still_pending = []
+            for table in pending_tables:
+                if line_is_below_table(table, line, tolerance):
+                    # Insert reference
+                    filtered_lines.append({
                         'type': 'table',
-                        'text': reference,
+                        'text': f"[Table {table['doc_index']}: {table['file']}]",
                         'bbox': table['bbox'],
-                    }
-                    filtered_lines.append(reference_rec)
-                    # print(f"Added Reference {reference_rec}")
+                    })
+                else:
+                    still_pending.append(table)
+            pending_tables = still_pending
 
             # check for line being above the header boundry, if
             # so move it to the header and footer list
@@ -467,7 +477,8 @@ def save_text_lines(pages_output, output_file):
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Analyze a PDF file and extract text with bounding boxes.')
+    parser = argparse.ArgumentParser(description='Analyze a PDF file and extract text with bounding boxes. '
+                                                 'Run from the top of the repository with python -m old_app.analyze')
     parser.add_argument('pdf_path', help='Path to the PDF file to analyze')
     parser.add_argument('-d', '--dir', default='pdf_analyze', help='Application output directory')
     parser.add_argument('-o', '--output', help='Base name for output directory (default: input file base name)')
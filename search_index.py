@@ -0,0 +1,185 @@
+import bisect
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+import pdfplumber
+import pymupdf
+
+from blocks.page_cache import page_hash
+
+# bump when the layout of the index file or the word extraction changes
+INDEX_VERSION = 1
+
+
+def file_hash(file_path):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_index_path(pdf_file):
+    return pdf_file + '.index.json'
+
+
+def extract_page_words(plumber_page):
+    """
+    Words of a page as [text, x0, top, x1, bottom] lists, in extract_words() order
+    """
+    return [[word['text'], word['x0'], word['top'], word['x1'], word['bottom']]
+            for word in plumber_page.extract_words()]
+
+
+class SearchIndex:
+    """
+    Word level inverted index of a PDF
+
+    Each page keeps its words (text and bbox) in reading order and every
+    distinct word text maps to its (page index, word position) postings.
+    The index is stored as JSON next to the PDF along with the hash of the
+    file and of each page, so an unchanged PDF is never parsed again and a
+    changed PDF only has its changed pages re-extracted.
+
+    Queries:
+        text      words containing text, as the original page scan did
+        text*     words starting with text
+        "a b c"   consecutive words a, b and c (also any query with spaces)
+    """
+
+    def __init__(self, pages, file_hash=None):
+        # pages: list of {'page_hash': ..., 'words': [[text, x0, top, x1, bottom], ...]}
+        self.pages = pages
+        self.file_hash = file_hash
+        self.postings = defaultdict(list)
+        for page_index, page in enumerate(pages):
+            for position, word in enumerate(page['words']):
+                self.postings[word[0]].append((page_index, position))
+        self.vocabulary = sorted(self.postings)
+
+    @classmethod
+    def load(cls, index_file):
+        """
+        Load a saved index, returns None if there is no usable index in the file
+        """
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if saved.get('version') != INDEX_VERSION:
+            return None
+
+        index = cls.__new__(cls)
+        index.pages = saved['pages']
+        index.file_hash = saved['file_hash']
+        index.postings = {term: [tuple(posting) for posting in postings] for term, postings in saved['terms'].items()}
+        index.vocabulary = sorted(index.postings)
+        return index
+
+    def save(self, index_file):
+        saved = {
+            'version': INDEX_VERSION,
+            'file_hash': self.file_hash,
+            'pages': self.pages,
+            'terms': self.postings,
+        }
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp_file, index_file)
+
+    @classmethod
+    def build(cls, pdf_file, previous=None):
+        """
+        Build the index of pdf_file, reusing the words of the pages of the
+        previous index whose content hash is unchanged
+        """
+        reusable = {}
+        if previous is not None:
+            reusable = {page['page_hash']: page['words'] for page in previous.pages}
+
+        with pymupdf.open(pdf_file) as doc:
+            font_hashes = {}
+            page_hashes = [page_hash(doc, page, font_hashes) for page in doc]
+
+        pages = []
+        extracted = 0
+        with pdfplumber.open(pdf_file) as pdf:
+            for page_number, content_hash in enumerate(page_hashes):
+                words = reusable.get(content_hash)
+                if words is None:
+                    words = extract_page_words(pdf.pages[page_number])
+                    extracted += 1
+                pages.append({'page_hash': content_hash, 'words': words})
+
+        print(f"Indexed {len(pages)} pages ({extracted} extracted, {len(pages) - extracted} unchanged)")
+        return cls(pages, file_hash(pdf_file))
+
+    @classmethod
+    def open(cls, pdf_file, index_file=None, rebuild=False):
+        """
+        Return the index of pdf_file, loading the saved index when the file is
+        unchanged and otherwise (re)building it and saving it
+        """
+        index_file = index_file or default_index_path(pdf_file)
+        previous = None if rebuild else cls.load(index_file)
+        if previous is not None and previous.file_hash == file_hash(pdf_file):
+            return previous
+
+        index = cls.build(pdf_file, previous)
+        index.save(index_file)
+        return index
+
+    def _word_match(self, page_index, position, length=1):
+        words = self.pages[page_index]['words'][position:position + length]
+        return {
+            'page_number': page_index + 1,
+            'text': " ".join(word[0] for word in words),
+            'x0': min(word[1] for word in words),
+            'top': min(word[2] for word in words),
+            'x1': max(word[3] for word in words),
+            'bottom': max(word[4] for word in words),
+        }
+
+    def _matches(self, terms):
+        # postings of several terms are merged back into page and reading order
+        postings = sorted(posting for term in terms for posting in self.postings[term])
+        return [self._word_match(page_index, position) for page_index, position in postings]
+
+    def search_substring(self, text):
+        return self._matches([term for term in self.vocabulary if text in term])
+
+    def search_prefix(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return self._matches(terms)
+
+    def search_phrase(self, phrase_terms):
+        if not phrase_terms:
+            return []
+
+        matches = []
+        for page_index, position in self.postings.get(phrase_terms[0], ()):
+            words = self.pages[page_index]['words']
+            following = words[position + 1:position + len(phrase_terms)]
+            if [word[0] for word in following] == phrase_terms[1:]:
+                matches.append(self._word_match(page_index, position, len(phrase_terms)))
+        return matches
+
+    def search(self, query):
+        query = query.strip()
+        if len(query) > 1 and query.startswith('"') and query.endswith('"'):
+            return self.search_phrase(query[1:-1].split())
+        if len(query.split()) > 1:
+            return self.search_phrase(query.split())
+        if len(query) > 1 and query.endswith('*'):
+            return self.search_prefix(query[:-1])
+        return self.search_substring(query)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import time
+from blocks.section_search import SectionSearchIndex
+
+
+def parse_arguments():
+    """
+    Parse command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Full-text search across the sections of all the processed documents')
+    parser.add_argument('query', nargs='*', help='Search terms (interactive search if not given)')
+    parser.add_argument('-ad', '--appdir', help='Application directory holding the processed documents', default='pdf_blocks')
+    parser.add_argument('-idx', '--index_file', help='Search index file (default: <appdir>/section_index.db)')
+    parser.add_argument('-i', '--ingest', action='store_true', help='Index the new and changed documents of the application directory before searching')
+    parser.add_argument('-n', '--limit', type=int, default=10, help='Number of results to show')
+    return parser.parse_args()
+
+
+def print_results(results, elapsed):
+    if not results:
+        print("No matches found.")
+        return
+
+    print(f"Found {len(results)} sections ({elapsed:.1f} ms):")
+    for result in results:
+        print(f"  {result['score']:7.3f}  {result['document']}  section {result['section_id']} "
+              f"\"{result['title']}\"  page {result['start_page']}  ({result['textfile']})")
+
+
+def main():
+    args = parse_arguments()
+    index_file = args.index_file or os.path.join(args.appdir, 'section_index.db')
+
+    with SectionSearchIndex(index_file) as index:
+        if args.ingest:
+            stats = index.ingest(args.appdir)
+            print(f"Indexed {stats['indexed']} documents, {stats['unchanged']} unchanged, {stats['removed']} removed")
+
+        if args.query:
+            start = time.perf_counter()
+            results = index.search(" ".join(args.query), args.limit)
+            print_results(results, (time.perf_counter() - start) * 1000)
+            return
+
+        print("Enter search terms (press Ctrl+D to exit):")
+        while True:
+            try:
+                query = input("Search for: ")
+            except EOFError:
+                print("\nExiting the search.")
+                break
+
+            start = time.perf_counter()
+            results = index.search(query, args.limit)
+            print_results(results, (time.perf_counter() - start) * 1000)
+            print()
+
+
+if __name__ == "__main__":
+    main()